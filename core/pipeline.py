@@ -706,7 +706,8 @@ class PipelineManager:
             return {'quota_manager_available': False}
         
         try:
-            quota_available = self.quota_manager.has_quota_available()
+            # 状态查询只读取缓存，不触发登录和 API 请求
+            quota_available = self.quota_manager.has_quota_available(refresh=False)
             return {
                 'quota_manager_available': True,
                 'quota_available': quota_available,
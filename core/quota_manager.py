@@ -5,32 +5,37 @@
 管理Z-Library下载配额，提供缓存和实时查询功能。
 """
 
+import time
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 
 from core.pipeline import NetworkError
 from services.zlibrary_service import ZLibraryService
 from utils.logger import get_logger
 
+# 默认配额缓存有效期（分钟）
+_CACHE_MINUTES = 5
 
-@dataclass
+
+@dataclass(slots=True)
 class DownloadQuota:
     """下载配额数据模型"""
     remaining_downloads: int
     daily_limit: int = 10
-    last_checked: Optional[datetime] = None
+    # 获取配额时的 time.monotonic() 值，None 表示从未获取；不受系统时钟调整影响
+    last_checked: Optional[float] = None
     next_reset: Optional[datetime] = None
     
     def has_quota_available(self) -> bool:
         """检查是否有可用配额"""
         return self.remaining_downloads > 0
     
-    def is_expired(self, cache_minutes: int = 5) -> bool:
+    def is_expired(self, cache_minutes: int = _CACHE_MINUTES) -> bool:
         """检查配额信息是否过期"""
         if self.last_checked is None:
             return True
-        return datetime.now() - self.last_checked > timedelta(minutes=cache_minutes)
+        return time.monotonic() - self.last_checked > cache_minutes * 60
 
 
 class QuotaManager:
@@ -86,7 +91,7 @@ class QuotaManager:
         # 从API获取最新配额
         try:
             self.logger.info("从Z-Library API获取配额信息")
-            quota_info = await self._fetch_quota_from_api()
+            quota_info = await self._fetch_quota_from_api(force_refresh)
             self._cached_quota = quota_info
             self.logger.info(f"配额获取成功: 剩余 {quota_info.remaining_downloads}/{quota_info.daily_limit}")
             return quota_info
@@ -95,43 +100,68 @@ class QuotaManager:
             self.logger.error(f"获取配额失败: {e}")
             raise NetworkError(f"无法获取Z-Library配额信息: {e}")
     
-    async def _fetch_quota_from_api(self) -> DownloadQuota:
+    async def _fetch_quota_from_api(self, force_refresh: bool = False) -> DownloadQuota:
         """从Z-Library API获取配额信息"""
         try:
             zlibrary_service = self._get_zlibrary_service()
             
-            # 调用Z-Library服务获取配额信息
-            # 注意：这里需要根据实际的zlibrary服务API调整
-            quota_data = await zlibrary_service.get_download_quota()
+            # 调用Z-Library服务获取配额信息；强制刷新时同时跳过服务自身的限制缓存
+            quota_data = await zlibrary_service.get_download_quota(force_refresh)
             
             return DownloadQuota(
                 remaining_downloads=quota_data.get('remaining', 0),
                 daily_limit=quota_data.get('daily_limit', 10),
-                last_checked=datetime.now(),
+                last_checked=time.monotonic(),
                 next_reset=quota_data.get('next_reset')
             )
             
         except Exception as e:
             raise NetworkError(f"Z-Library API调用失败: {e}")
     
-    def has_quota_available(self) -> bool:
+    def _refresh_quota_sync(self) -> Optional[DownloadQuota]:
+        """
+        同步刷新配额缓存，供非异步调用方在缓存缺失或过期时使用
+        
+        Returns:
+            Optional[DownloadQuota]: 刷新后的配额，失败时返回None（保留原缓存）
+        """
+        try:
+            limits = self._get_zlibrary_service().get_download_limits(
+                force_refresh=True, raise_on_error=True)
+        except Exception as e:
+            self.logger.error(f"刷新配额失败: {e}")
+            return None
+        
+        self._cached_quota = DownloadQuota(
+            remaining_downloads=limits.get('daily_remaining', 0),
+            daily_limit=limits.get('daily_amount', 10),
+            last_checked=time.monotonic(),
+            next_reset=limits.get('daily_reset')
+        )
+        self.logger.debug(f"配额已刷新: {self._cached_quota.remaining_downloads}/{self._cached_quota.daily_limit}")
+        return self._cached_quota
+    
+    def has_quota_available(self, refresh: bool = True) -> bool:
         """
         检查是否有可用下载配额 (使用缓存)
         
+        Args:
+            refresh: 缓存缺失或过期时是否同步刷新（会登录并请求 API）；
+                为 False 时只读取缓存，没有缓存时返回 False
+        
         Returns:
             bool: True如果有可用配额，False如果配额为0
         """
+        # 缓存缺失或过期时同步刷新；异步调用方应先 await get_current_quota()
+        if refresh and (self._cached_quota is None
+                        or self._cached_quota.is_expired(self.cache_minutes)):
+            self.logger.debug("配额缓存缺失或已过期，刷新配额")
+            if self._refresh_quota_sync() is None:
+                self.logger.debug("刷新配额失败，沿用原有缓存")
+        
         if self._cached_quota is None:
-            # 如果没有缓存，默认返回False（需要先获取配额信息）
-            self.logger.warning("配额信息未初始化，请先调用get_current_quota()")
+            # 没有可用的配额信息
             return False
-        
-        # 如果缓存过期，需要刷新
-        if self._cached_quota.is_expired(self.cache_minutes):
-            self.logger.debug("配额缓存已过期，需要刷新")
-            # 这里可以选择异步刷新或返回缓存值
-            # 为了简化，暂时返回缓存值
-        
         return self._cached_quota.has_quota_available()
     
     def consume_quota(self, count: int = 1) -> bool:
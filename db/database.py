@@ -44,8 +44,10 @@ class Database:
         self.logger = get_logger("database")
         self.engine = create_engine(self.db_url)
         self.Session = scoped_session(sessionmaker(bind=self.engine))
-        # 为新架构提供session_factory
-        self.session_factory = sessionmaker(bind=self.engine)
+        # 为新架构提供session_factory；提交后不使对象过期，
+        # 会话关闭后仍可读取已加载的属性，也避免提交后访问属性时重新查询
+        self.session_factory = sessionmaker(bind=self.engine,
+                                            expire_on_commit=False)
 
 
     def init_db(self) -> None:
@@ -161,8 +163,7 @@ class Database:
             status: 新状态
         """
         with self.session_scope() as session:
-            book = session.query(DoubanBook).filter(
-                DoubanBook.id == book_id).first()
+            book = session.get(DoubanBook, book_id)
             if book:
                 old_status = book.status
                 book.status = status
@@ -181,8 +182,7 @@ class Database:
             book_data: 书籍数据字典
         """
         with self.session_scope() as session:
-            book = session.query(DoubanBook).filter(
-                DoubanBook.id == book_id).first()
+            book = session.get(DoubanBook, book_id)
             if book:
                 for key, value in book_data.items():
                     if hasattr(book, key):
@@ -237,8 +237,7 @@ class Database:
             record_data: 下载记录数据字典
         """
         with self.session_scope() as session:
-            record = session.query(DownloadRecord).filter(
-                DownloadRecord.id == record_id).first()
+            record = session.get(DownloadRecord, record_id)
             if record:
                 for key, value in record_data.items():
                     if hasattr(record, key):
@@ -308,8 +307,7 @@ class Database:
             book_data: 书籍数据字典
         """
         with self.session_scope() as session:
-            book = session.query(ZLibraryBook).filter(
-                ZLibraryBook.id == book_id).first()
+            book = session.get(ZLibraryBook, book_id)
             if book:
                 for key, value in book_data.items():
                     if hasattr(book, key):
@@ -370,7 +368,7 @@ class Database:
             retry_count: 重试次数
         """
         with self.session_scope() as session:
-            book = session.query(DoubanBook).filter(DoubanBook.id == book_id).first()
+            book = session.get(DoubanBook, book_id)
             if book:
                 old_status = book.status
                 book.status = new_status
@@ -299,6 +299,33 @@ class Migration:
         
         self.logger.info("迁移 v005 完成")
     
+    def migrate_v006_add_quota_exhausted_index(self) -> None:
+        """
+        迁移 v006: 为配额耗尽的书籍创建部分索引
+        """
+        self.logger.info("开始迁移 v006: 创建配额耗尽书籍部分索引")
+        
+        # 状态列按枚举名称存储
+        self._execute_sql(
+            "CREATE INDEX IF NOT EXISTS ix_douban_books_quota_exhausted "
+            "ON douban_books (id) WHERE status = 'SEARCH_COMPLETE_QUOTA_EXHAUSTED'"
+        )
+        
+        self.logger.info("迁移 v006 完成")
+    
+    def migrate_v007_add_best_match_index(self) -> None:
+        """
+        迁移 v007: 为选择最佳匹配创建复合索引
+        """
+        self.logger.info("开始迁移 v007: 创建最佳匹配复合索引")
+        
+        self._execute_sql(
+            "CREATE INDEX IF NOT EXISTS ix_zlibrary_books_best_match "
+            "ON zlibrary_books (douban_id, is_available, match_score DESC)"
+        )
+        
+        self.logger.info("迁移 v007 完成")
+    
     def run_migrations(self) -> None:
         """
         运行所有未执行的迁移
@@ -315,6 +342,8 @@ class Migration:
             (3, self.migrate_v003_create_zlibrary_books),
             (4, self.migrate_v004_add_zlib_dl_url),
             (5, self.migrate_v005_create_book_status_history),
+            (6, self.migrate_v006_add_quota_exhausted_index),
+            (7, self.migrate_v007_add_best_match_index),
         ]
         
         for version, migration_func in migrations:
@@ -9,7 +9,7 @@ import enum
 from datetime import datetime
 
 from sqlalchemy import (JSON, Boolean, Column, DateTime, Enum, Float,
-                        ForeignKey, Integer, String, Text)
+                        ForeignKey, Index, Integer, String, Text)
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -88,6 +88,12 @@ class DoubanBook(Base):
         return f"<DoubanBook(id={self.id}, title='{self.title}', author='{self.author}', status='{self.status.value if self.status else 'None'}')>"
 
 
+# 配额耗尽书籍的部分索引：恢复处理时按状态查找，只索引匹配的少量行
+Index('ix_douban_books_quota_exhausted', DoubanBook.id,
+      sqlite_where=DoubanBook.status == BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED,
+      postgresql_where=DoubanBook.status == BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED)
+
+
 class DownloadRecord(Base):
     """下载记录数据模型"""
     __tablename__ = 'download_records'
@@ -153,6 +159,11 @@ class ZLibraryBook(Base):
         return f"<ZLibraryBook(id={self.id}, zlibrary_id='{self.zlibrary_id}', title='{self.title}', format='{self.extension}', score={self.match_score})>"
 
 
+# 选择最佳匹配时按豆瓣ID和可用性过滤、按匹配分数降序取前几条，复合索引可直接按序读取
+Index('ix_zlibrary_books_best_match', ZLibraryBook.douban_id,
+      ZLibraryBook.is_available, ZLibraryBook.match_score.desc())
+
+
 class DownloadQueue(Base):
     """下载队列数据模型 - 存储匹配度最高的待下载书籍"""
     __tablename__ = 'download_queue'
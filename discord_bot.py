@@ -119,6 +119,8 @@ class BookDownloader:
             zlib_config = self.config_manager.get_zlibrary_config()
             
             # Recreate ZLibraryService with new credentials
+            # (đóng service cũ để giải phóng event loop và HTTP session)
+            self.zlibrary_service.close()
             self.zlibrary_service = ZLibraryService(
                 email=username,
                 password=password,
@@ -559,7 +561,9 @@ class BookDownloader:
                             logger.error(f"get_by_id failed: {e}")
                             return None
                     
-                    book_details = asyncio.run(get_book_by_id())
+                    # Chạy trên event loop của client, nơi phiên zlibrary được tạo;
+                    # await để không chặn event loop của discord.py
+                    book_details = await self.zlibrary_service.client.run_async(get_book_by_id())
                     
                     if not book_details:
                         return {
@@ -676,7 +680,9 @@ class BookDownloader:
                             logger.error(f"get_by_id failed: {e}")
                             return None
                     
-                    book_details = asyncio.run(get_book_by_id())
+                    # Chạy trên event loop của client, nơi phiên zlibrary được tạo;
+                    # await để không chặn event loop của discord.py
+                    book_details = await self.zlibrary_service.client.run_async(get_book_by_id())
                     
                     if not book_details:
                         return {
@@ -1134,7 +1140,7 @@ async def slash_quota(interaction: discord.Interaction):
     await interaction.response.defer()
     
     try:
-        limits = downloader.zlibrary_service.get_download_limits()
+        limits = await downloader.zlibrary_service.get_download_limits_async(force_refresh=True)
         
         embed = discord.Embed(
             title="📊 Z-Library Download Quota",
@@ -1177,7 +1183,7 @@ async def slash_set_credentials(interaction: discord.Interaction, email: str, pa
         if success:
             # Get new quota info
             try:
-                limits = downloader.zlibrary_service.get_download_limits()
+                limits = await downloader.zlibrary_service.get_download_limits_async(force_refresh=True)
                 quota_info = (
                     f"\n\n📊 **New Account Quota:**\n"
                     f"• Daily Limit: {limits.get('daily_amount', 'N/A')}\n"
@@ -1324,7 +1330,7 @@ async def ping_command(ctx):
 async def quota_command(ctx):
     """Prefix command: !quota"""
     try:
-        limits = downloader.zlibrary_service.get_download_limits()
+        limits = await downloader.zlibrary_service.get_download_limits_async(force_refresh=True)
         
         embed = discord.Embed(
             title="📊 Z-Library Download Quota",
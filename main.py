@@ -221,7 +221,8 @@ class DoubanZLibraryCalibrer:
         zlib_config = self.config_manager.get_zlibrary_config()
         search_stage = SearchStage(
             self.state_manager, self.zlibrary_service, self.calibre_service,
-            min_match_score=zlib_config.get('min_match_score', 0.6)
+            min_match_score=zlib_config.get('min_match_score', 0.6),
+            save_score_floor=zlib_config.get('save_score_floor')
         )
         self.pipeline_manager.register_stage(search_stage)
         
@@ -5,14 +5,115 @@ Calibre 服务
 负责通过 calibredb 命令与 Calibre 交互，查询和上传书籍。
 """
 
-import json
 import os
 import re
 import subprocess
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
+
+import requests
+from rapidfuzz import fuzz as _fuzz
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth, HTTPDigestAuth
 
 from utils.logger import get_logger
 
+# 优先使用 C 实现的 JSON 解析器，calibredb list 的输出可能有数 MB
+try:
+    import orjson as _json
+except ImportError:
+    try:
+        import ujson as _json
+    except ImportError:
+        import json as _json
+
+_loads = _json.loads
+
+# 标题清理：移除副标题和特殊字符之后的内容
+_TITLE_CLEAN_RE = re.compile(r'[:\(\)\[\]\{\}].*$')
+
+# calibredb add 输出中的书籍 ID，兼容以下格式：
+#   Added book ids: 123 / Book id of imported book: 123
+#   已加入的书籍id: 1420 / 书籍id: 1420 / id: 1420
+_ADD_ID_RE = re.compile(
+    r'(?:Added book ids?|Book id of imported book|已加入的书籍id|书籍id|id)'
+    r'\s*:\s*(\d+)', re.IGNORECASE)
+
+# ISBN 归一化：只保留数字和校验位 X
+_ISBN_STRIP_RE = re.compile(r'[^0-9Xx]')
+
+# calibredb add 元数据字段 -> 命令行参数
+_ADD_SCALAR_FLAGS = (
+    ('title', '--title'),
+    ('isbn', '--isbn'),
+    ('series', '--series'),
+    ('series_index', '--series-index'),
+)
+_ADD_LIST_FLAGS = (
+    ('authors', '--authors'),
+    ('tags', '--tags'),
+)
+
+# 书籍信息缓存超过该条目数时清理过期条目
+_BOOK_CACHE_SWEEP_SIZE = 10000
+
+# calibredb list 每次查询的最大 ID 数
+_LIST_IDS_BATCH_SIZE = 200
+
+# 最佳匹配结果缓存的最大条目数
+_MATCH_CACHE_MAX = 4096
+
+# 全库 ISBN 索引的有效期（秒），过期后下次查询时重建
+_ISBN_INDEX_TTL = 600.0
+
+# Content Server 接口的连接超时（秒），服务不可达时尽快回退到 calibredb
+_HTTP_CONNECT_TIMEOUT = 5.0
+
+# 这些状态码说明接口不可用（认证方式不兼容或不支持 AJAX），之后不再尝试
+_HTTP_DISABLE_STATUS_CODES = frozenset((401, 403, 404))
+
+
+def _norm_isbn(isbn: str) -> str:
+    """将 ISBN 归一化为不含分隔符的 13 位形式，便于比较；格式无效时返回空字符串"""
+    digits = _ISBN_STRIP_RE.sub('', isbn).upper()
+    if len(digits) == 10 and digits[:9].isdigit():
+        # ISBN-10 转 ISBN-13：加 978 前缀并重新计算校验位
+        body = '978' + digits[:9]
+        total = sum(int(d) * (1 if i % 2 == 0 else 3)
+                    for i, d in enumerate(body))
+        return body + str((10 - total % 10) % 10)
+    if len(digits) == 13 and digits.isdigit():
+        return digits
+    return ''
+
+
+def _cache_key(title: Optional[str], author: Optional[str],
+               isbn: Optional[str]) -> Tuple[str, str, str]:
+    """搜索和匹配缓存共用的归一化缓存键"""
+    return ((title or '').lower().strip(), (author or '').lower().strip(),
+            isbn or '')
+
+
+def _tokenize(text: str) -> FrozenSet[str]:
+    """将文本切分为小写词集合，用于相似度计算"""
+    return frozenset(text.lower().split())
+
+
+@dataclass(slots=True)
+class CalibredbResult:
+    """calibredb 命令执行结果"""
+    stdout: Union[str, bytes]
+    stderr: str
+    returncode: int
+
+    @property
+    def ok(self) -> bool:
+        """命令是否成功执行"""
+        return self.returncode == 0
+
 
 class CalibreService:
     """Calibre 服务类"""
@@ -38,10 +139,65 @@ class CalibreService:
         self.match_threshold = match_threshold
         self.timeout = 120  # 2 分钟超时
 
+        # calibredb 的连接/认证参数在实例生命周期内不变，只构建一次
+        self._auth_args: List[str] = []
+        if self.server_url:
+            self._auth_args += ['--library-path', self.server_url]
+        if self.username:
+            self._auth_args += ['--username', self.username]
+        if self.password:
+            self._auth_args += ['--password', self.password]
+        self._auth_args += ['--timeout', str(self.timeout)]
+        # calibredb 本身是 Python 程序，跳过 .pyc 写入
+        self._env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+
+        # 搜索结果 LRU 缓存：(标题, 作者, ISBN) -> (缓存时间, 书籍列表)，
+        # 有效期与书籍信息缓存相同
+        self._search_cache: OrderedDict = OrderedDict()
+        self._search_cache_max = 1024
+        self._search_cache_lock = threading.Lock()
+
+        # 最佳匹配 LRU 缓存：(标题, 作者, ISBN) -> (缓存时间, 最佳匹配或None)，
+        # 与书籍信息缓存使用相同的有效期，与搜索缓存共用锁，书库变更时一起清空
+        self._match_cache: OrderedDict = OrderedDict()
+
+        # 书籍信息 TTL 缓存：calibre_id -> (缓存时间, 书籍信息)
+        self._book_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self._book_cache_ttl = 60.0
+        self._book_cache_lock = threading.Lock()
+
+        # 书籍标题/作者的词集合缓存：(calibre_id, 字段) -> (原文, 词集合)
+        self._token_cache: Dict[Tuple[Any, str], Tuple[str, FrozenSet[str]]] = {}
+
+        # 全库 ISBN 索引：归一化 ISBN -> calibre_id，及其构建时间
+        self._isbn_index: Optional[Dict[str, int]] = None
+        self._isbn_index_built_at = 0.0
+        self._isbn_index_lock = threading.Lock()
+        # 正在重建索引时其他线程继续使用旧索引；clear_cache 递增版本号，
+        # 丢弃在清空之前开始构建的索引
+        self._isbn_index_building = False
+        self._isbn_index_version = 0
+
+        # Content Server HTTP 会话：search/list 直接走 AJAX 接口，
+        # 复用 keep-alive 连接，避免每次 fork calibredb 并重新认证
+        self._http_enabled = self.server_url.startswith(('http://', 'https://'))
+        self._http_base, _, self._library_id = self.server_url.partition('#')
+        self._http_base = self._http_base.rstrip('/')
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=5, pool_maxsize=20)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        if username:
+            # Content Server 默认在 HTTP 下使用 Digest 认证，HTTPS 下使用 Basic
+            if self.server_url.startswith('https://'):
+                self._session.auth = HTTPBasicAuth(username, password)
+            else:
+                self._session.auth = HTTPDigestAuth(username, password)
+
     def _execute_calibredb_command(
             self,
             args: List[str],
-            cwd: Optional[str] = None) -> Tuple[str, str, int]:
+            cwd: Optional[str] = None) -> CalibredbResult:
         """
         执行 calibredb 命令
 
@@ -50,39 +206,167 @@ class CalibreService:
             cwd: 工作目录（可选）
 
         Returns:
-            Tuple[str, str, int]: stdout, stderr, return_code
+            CalibredbResult: 命令执行结果，stdout 为 str
         """
-        # 构建完整命令
-        cmd = ['calibredb'] + args
+        result = self._run_calibredb(args, cwd=cwd, text=True)
+        return CalibredbResult(result.stdout, result.stderr, result.returncode)
 
-        # 添加认证参数
-        if self.server_url:
-            cmd.extend(['--library-path', self.server_url])
-        if self.username:
-            cmd.extend(['--username', self.username])
-        if self.password:
-            cmd.extend(['--password', self.password])
+    def _execute_calibredb_bytes(
+            self,
+            args: List[str],
+            cwd: Optional[str] = None) -> CalibredbResult:
+        """
+        执行 calibredb 命令，stdout 以原始字节返回
+
+        用于 list --for-machine 这类大输出，字节直接交给 JSON 解析器，
+        省去一次完整的 UTF-8 解码。
+
+        Args:
+            args: 命令参数列表
+            cwd: 工作目录（可选）
+
+        Returns:
+            CalibredbResult: 命令执行结果，stdout 为 bytes
+        """
+        result = self._run_calibredb(args, cwd=cwd, text=False)
+        stderr = result.stderr.decode('utf-8', errors='replace')
+        return CalibredbResult(result.stdout, stderr, result.returncode)
+
+    def _run_calibredb(self, args: List[str], cwd: Optional[str],
+                       text: bool) -> subprocess.CompletedProcess:
+        """
+        构建并执行 calibredb 命令
+
+        非零退出码通过返回值体现；只有超时或找不到 calibredb 时才抛出异常。
+
+        Args:
+            args: 命令参数列表
+            cwd: 工作目录
+            text: 是否以文本模式读取输出
+
+        Returns:
+            subprocess.CompletedProcess: 命令执行结果
 
-        # 添加超时参数
-        cmd.extend(['--timeout', str(self.timeout)])
+        Raises:
+            subprocess.TimeoutExpired: 命令执行超时
+            FileNotFoundError: 未安装 calibredb
+        """
+        # 构建完整命令（认证和超时参数在初始化时已预先构建）
+        cmd = ['calibredb', *args, *self._auth_args]
 
         self.logger.debug(f"执行 calibredb 命令: {' '.join(cmd[:3])} ...")
 
         try:
-            result = subprocess.run(
+            return subprocess.run(
                 cmd,
                 cwd=cwd,
+                env=self._env,
                 capture_output=True,
-                text=True,
+                text=text,
                 timeout=self.timeout + 10  # 给命令额外的超时缓冲
             )
-            return result.stdout, result.stderr, result.returncode
-        except subprocess.TimeoutExpired as e:
+        except subprocess.TimeoutExpired:
             self.logger.error(f"calibredb 命令超时: {' '.join(cmd[:3])}")
-            raise Exception(f"命令执行超时: {e}")
-        except Exception as e:
-            self.logger.error(f"执行 calibredb 命令失败: {str(e)}")
-            raise Exception(f"命令执行失败: {e}")
+            raise
+        except FileNotFoundError:
+            self.logger.error("未找到 calibredb 命令，请确认已安装 Calibre")
+            raise
+
+    def _http_get_json(self, endpoint: str,
+                       params: Dict[str, Any]) -> Optional[Any]:
+        """
+        调用 Content Server AJAX 接口
+
+        Args:
+            endpoint: 接口路径，如 /ajax/search
+            params: 查询参数
+
+        Returns:
+            Optional[Any]: 解析后的 JSON，不可用或请求失败时返回 None，
+            由调用方回退到 calibredb；认证或协议错误后不再尝试接口
+        """
+        if not self._http_enabled:
+            return None
+
+        url = f"{self._http_base}{endpoint}"
+        if self._library_id:
+            url = f"{url}/{self._library_id}"
+
+        try:
+            response = self._session.get(url,
+                                         params=params,
+                                         timeout=(_HTTP_CONNECT_TIMEOUT,
+                                                  self.timeout))
+            if response.status_code in _HTTP_DISABLE_STATUS_CODES:
+                self._disable_http(
+                    endpoint, f"HTTP状态码 {response.status_code}")
+                return None
+            response.raise_for_status()
+            return _loads(response.content)
+        except ValueError as e:
+            # 返回的不是 JSON，说明该地址不是 Content Server 接口
+            self._disable_http(endpoint, str(e))
+            return None
+        except requests.RequestException as e:
+            self.logger.debug(f"Content Server 接口请求失败，回退到 calibredb: "
+                              f"{endpoint}, 错误: {str(e)}")
+            return None
+
+    def _disable_http(self, endpoint: str, reason: str) -> None:
+        """
+        停用 Content Server 接口，之后的查询直接使用 calibredb
+
+        Args:
+            endpoint: 出错的接口路径
+            reason: 停用原因
+        """
+        self._http_enabled = False
+        self.logger.warning(f"Content Server 接口不可用，改用 calibredb: "
+                            f"{endpoint}, 原因: {reason}")
+
+    def _http_search(self, search_query: str) -> Optional[List[int]]:
+        """
+        通过 /ajax/search 搜索书籍 ID
+
+        Args:
+            search_query: Calibre 搜索表达式
+
+        Returns:
+            Optional[List[int]]: 书籍 ID 列表，接口不可用时返回 None
+        """
+        data = self._http_get_json('/ajax/search', {
+            'query': search_query,
+            'num': 1000
+        })
+        if not isinstance(data, dict):
+            return None
+        return [int(book_id) for book_id in data.get('book_ids', [])]
+
+    def _http_books_info(
+            self,
+            book_ids: List[int],
+            include_raw: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        通过 /ajax/books 批量获取书籍元数据
+
+        Args:
+            book_ids: 书籍 ID 列表
+            include_raw: 是否在结果中保留原始元数据（raw_data 字段）
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: 书籍详细信息列表，接口不可用时返回 None
+        """
+        data = self._http_get_json(
+            '/ajax/books', {'ids': ','.join(str(i) for i in book_ids)})
+        if not isinstance(data, dict):
+            return None
+
+        # 接口返回 {id: metadata}，不存在的 ID 对应 null
+        books_data = []
+        for book_id, book_data in data.items():
+            if book_data:
+                books_data.append({**book_data, 'id': int(book_id)})
+        return self._build_book_list(books_data, include_raw)
 
     def _parse_search_results(self, book_ids_str: str) -> List[int]:
         """
@@ -108,55 +392,73 @@ class CalibreService:
             self.logger.error(f"解析书籍 ID 失败: {book_ids_str}, 错误: {str(e)}")
             return []
 
-    def _parse_book_list(self, json_output: str) -> List[Dict[str, Any]]:
+    def _parse_book_list(self,
+                         json_output: Union[str, bytes],
+                         include_raw: bool = False) -> List[Dict[str, Any]]:
         """
         解析 calibredb list 的 JSON 输出
 
         Args:
-            json_output: calibredb list --for-machine 的输出
+            json_output: calibredb list --for-machine 的输出（str 或 bytes）
+            include_raw: 是否在结果中保留原始元数据（raw_data 字段）
 
         Returns:
             List[Dict[str, Any]]: 书籍信息列表
         """
         try:
-            books_data = json.loads(json_output)
-            books = []
-
-            for book_data in books_data:
-                # 处理 authors 字段 - 确保是列表格式
-                authors_data = book_data.get('authors', [])
-                if isinstance(authors_data, str):
-                    # 如果是字符串，按 ' & ' 分割成列表
-                    authors_list = [
-                        author.strip() for author in authors_data.split(' & ')
-                    ]
-                elif isinstance(authors_data, list):
-                    authors_list = authors_data
-                else:
-                    authors_list = []
-
-                book_info = {
-                    'calibre_id': book_data.get('id', 0),
-                    'title': book_data.get('title', ''),
-                    'authors': authors_list,
-                    'author': ', '.join(authors_list),
-                    'publisher': book_data.get('publisher', ''),
-                    'identifiers': book_data.get('identifiers', {}),
-                    'isbn': book_data.get('identifiers', {}).get('isbn', ''),
-                    'formats': book_data.get('formats', []),
-                    'cover_url': '',  # calibredb 不直接提供封面 URL
-                    'raw_data': book_data
-                }
-                books.append(book_info)
-
-            return books
-        except json.JSONDecodeError as e:
+            return self._build_book_list(_loads(json_output), include_raw)
+        except ValueError as e:
+            # json/orjson/ujson 的解析错误均为 ValueError 子类
             self.logger.error(f"解析 JSON 输出失败: {str(e)}")
             return []
         except Exception as e:
             self.logger.error(f"处理书籍列表失败: {str(e)}")
             return []
 
+    def _build_book_list(self,
+                         books_data: List[Dict[str, Any]],
+                         include_raw: bool = False) -> List[Dict[str, Any]]:
+        """
+        将 calibredb / Content Server 返回的原始元数据转换为书籍信息
+
+        Args:
+            books_data: 原始书籍元数据列表
+            include_raw: 是否在结果中保留原始元数据（raw_data 字段）
+
+        Returns:
+            List[Dict[str, Any]]: 书籍信息列表
+        """
+        books = []
+        append = books.append
+
+        for book_data in books_data:
+            # 处理 authors 字段 - 确保是列表格式
+            authors = book_data.get('authors') or []
+            if isinstance(authors, str):
+                # 如果是字符串，按 ' & ' 分割成列表
+                authors = [author.strip() for author in authors.split(' & ')]
+            elif not isinstance(authors, list):
+                authors = []
+
+            identifiers = book_data.get('identifiers') or {}
+
+            book_info = {
+                'calibre_id': book_data.get('id', 0),
+                'title': book_data.get('title', ''),
+                'authors': authors,
+                'author': ', '.join(authors),
+                'publisher': book_data.get('publisher', ''),
+                'identifiers': identifiers,
+                'isbn': identifiers.get('isbn', ''),
+                'formats': book_data.get('formats') or [],
+                'cover_url': '',  # calibredb 不直接提供封面 URL
+            }
+            if include_raw:
+                book_info['raw_data'] = book_data
+            append(book_info)
+
+        return books
+
     def search_book(self,
                     title: str,
                     author: Optional[str] = None,
@@ -174,6 +476,16 @@ class CalibreService:
         Returns:
             List[Dict[str, Any]]: 搜索结果列表
         """
+        cache_key = _cache_key(title, author, isbn)
+        with self._search_cache_lock:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                if time.monotonic() - cached[0] < self._book_cache_ttl:
+                    self._search_cache.move_to_end(cache_key)
+                    self.logger.debug(f"命中搜索缓存: {cache_key}")
+                    return cached[1]
+                del self._search_cache[cache_key]
+
         try:
             # 构建搜索查询
             query_parts = []
@@ -186,8 +498,7 @@ class CalibreService:
                 # 使用标题和作者搜索
                 if title:
                     # 对标题进行处理，移除副标题和特殊字符
-                    clean_title = re.sub(r'[:\(\)\[\]\{\}].*$', '',
-                                         title).strip()
+                    clean_title = _TITLE_CLEAN_RE.sub('', title).strip()
                     # 使用模糊匹配
                     query_parts.append(f'title:~"{clean_title}"')
 
@@ -214,35 +525,86 @@ class CalibreService:
                     command.extend(['--password', '***'])  # 不显示真实密码
                 print(f"calibredb 命令: {' '.join(command)}")
 
-            stdout, stderr, returncode = self._execute_calibredb_command(
-                search_args)
+            # 优先走 Content Server 接口，不可用时回退到 calibredb
+            book_ids = self._http_search(search_query)
+            if book_ids is None:
+                result = self._execute_calibredb_command(search_args)
 
-            if returncode != 0:
-                self.logger.warning(f"搜索失败: {stderr}")
-                return []
+                if not result.ok:
+                    self.logger.warning(f"搜索失败: {result.stderr}")
+                    return []
 
-            # 解析搜索结果
-            book_ids = self._parse_search_results(stdout)
+                # 解析搜索结果
+                book_ids = self._parse_search_results(result.stdout)
 
             if not book_ids:
                 self.logger.info(f"未找到匹配的书籍: {search_query}")
+                self._cache_search_result(cache_key, [])
                 return []
 
             self.logger.info(f"搜索成功，找到 {len(book_ids)} 个结果")
 
-            # 获取书籍详细信息
-            return self._get_books_info(book_ids)
+            # 获取书籍详细信息，获取失败（空列表）时不缓存
+            books = self._get_books_info(book_ids)
+            if books:
+                self._cache_search_result(cache_key, books)
+            return books
 
         except Exception as e:
             self.logger.error(f"搜索书籍失败: {str(e)}")
             return []
 
-    def _get_books_info(self, book_ids: List[int]) -> List[Dict[str, Any]]:
+    def _cache_search_result(self, cache_key: Tuple[str, str, str],
+                             books: List[Dict[str, Any]]) -> None:
+        """
+        写入搜索缓存，超过容量时淘汰最久未使用的条目
+
+        Args:
+            cache_key: (标题, 作者, ISBN) 归一化后的缓存键
+            books: 搜索结果
+        """
+        with self._search_cache_lock:
+            self._search_cache[cache_key] = (time.monotonic(), books)
+            self._search_cache.move_to_end(cache_key)
+            while len(self._search_cache) > self._search_cache_max:
+                self._search_cache.popitem(last=False)
+
+    def _cache_match_result(self, cache_key: Tuple[str, str, str],
+                            match: Optional[Dict[str, Any]]) -> None:
+        """
+        写入最佳匹配缓存，超过容量时淘汰最久未使用的条目
+
+        Args:
+            cache_key: (标题, 作者, ISBN) 归一化后的缓存键
+            match: 最佳匹配的书籍，没有满足阈值的匹配时为 None
+        """
+        with self._search_cache_lock:
+            self._match_cache[cache_key] = (time.monotonic(), match)
+            self._match_cache.move_to_end(cache_key)
+            while len(self._match_cache) > _MATCH_CACHE_MAX:
+                self._match_cache.popitem(last=False)
+
+    def clear_cache(self) -> None:
+        """清空搜索缓存、匹配缓存、书籍信息缓存、词集合缓存和 ISBN 索引"""
+        with self._search_cache_lock:
+            self._search_cache.clear()
+            self._match_cache.clear()
+        with self._book_cache_lock:
+            self._book_cache.clear()
+        self._token_cache.clear()
+        with self._isbn_index_lock:
+            self._isbn_index = None
+            self._isbn_index_version += 1
+
+    def _get_books_info(self,
+                        book_ids: List[int],
+                        include_raw: bool = False) -> List[Dict[str, Any]]:
         """
         批量获取书籍详细信息
 
         Args:
             book_ids: 书籍 ID 列表
+            include_raw: 是否在结果中保留原始元数据（raw_data 字段）
 
         Returns:
             List[Dict[str, Any]]: 书籍详细信息列表
@@ -250,29 +612,159 @@ class CalibreService:
         if not book_ids:
             return []
 
+        # 需要原始元数据时绕过缓存（缓存条目不含 raw_data）
+        if include_raw:
+            return self._fetch_books_info(book_ids, include_raw=True)
+
+        now = time.monotonic()
+        found: Dict[int, Dict[str, Any]] = {}
+        misses = []
+        with self._book_cache_lock:
+            for book_id in book_ids:
+                entry = self._book_cache.get(book_id)
+                if entry and now - entry[0] < self._book_cache_ttl:
+                    found[book_id] = entry[1]
+                else:
+                    misses.append(book_id)
+
+        if misses:
+            fetched = self._fetch_books_info(misses)
+            with self._book_cache_lock:
+                for book in fetched:
+                    found[book['calibre_id']] = book
+                    self._book_cache[book['calibre_id']] = (now, book)
+                if len(self._book_cache) > _BOOK_CACHE_SWEEP_SIZE:
+                    self._sweep_book_cache(now)
+
+        return [found[book_id] for book_id in book_ids if book_id in found]
+
+    def _sweep_book_cache(self, now: float) -> None:
+        """
+        清理过期的书籍缓存条目（调用方需持有 _book_cache_lock）
+
+        Args:
+            now: 当前 time.monotonic() 时间
+        """
+        expired = [
+            book_id for book_id, (cached_at, _) in self._book_cache.items()
+            if now - cached_at >= self._book_cache_ttl
+        ]
+        for book_id in expired:
+            del self._book_cache[book_id]
+
+    def _fetch_books_info(self,
+                          book_ids: List[int],
+                          include_raw: bool = False) -> List[Dict[str, Any]]:
+        """
+        从 Calibre 获取书籍详细信息（不经过缓存）
+
+        Args:
+            book_ids: 书籍 ID 列表
+            include_raw: 是否在结果中保留原始元数据（raw_data 字段）
+
+        Returns:
+            List[Dict[str, Any]]: 书籍详细信息列表
+        """
         try:
-            # 构建 ID 搜索查询
-            id_query = " or ".join([f"id:{book_id}" for book_id in book_ids])
+            books = self._http_books_info(book_ids, include_raw)
+            if books is not None:
+                return books
 
-            # 使用 calibredb list 获取详细信息
-            list_args = [
-                'list', '--for-machine', '--fields', 'all', '--search',
-                id_query
-            ]
+            # calibredb 搜索语法没有 ID 集合过滤，只能用 or 连接；
+            # 分批执行以避免超长查询和参数列表过长
+            books = []
+            for start in range(0, len(book_ids), _LIST_IDS_BATCH_SIZE):
+                batch = book_ids[start:start + _LIST_IDS_BATCH_SIZE]
+                id_query = " or ".join(f"id:{book_id}" for book_id in batch)
 
-            stdout, stderr, returncode = self._execute_calibredb_command(
-                list_args)
+                # 使用 calibredb list 获取详细信息
+                list_args = [
+                    'list', '--for-machine', '--fields', 'all', '--search',
+                    id_query
+                ]
 
-            if returncode != 0:
-                self.logger.error(f"获取书籍信息失败: {stderr}")
-                return []
+                result = self._execute_calibredb_bytes(list_args)
+
+                if not result.ok:
+                    self.logger.error(f"获取书籍信息失败: {result.stderr}")
+                    return []
 
-            return self._parse_book_list(stdout)
+                books.extend(self._parse_book_list(result.stdout, include_raw))
+
+            return books
 
         except Exception as e:
             self.logger.error(f"批量获取书籍信息失败: {str(e)}")
             return []
 
+    def build_lookup_index(self) -> Optional[Dict[str, int]]:
+        """
+        一次性列出全库书籍的 ISBN，构建 ISBN -> calibre_id 索引
+
+        Returns:
+            Optional[Dict[str, int]]: 以归一化 ISBN 为键的索引，获取失败时返回 None
+        """
+        try:
+            result = self._execute_calibredb_bytes(
+                ['list', '--for-machine', '--fields', 'identifiers'])
+            if not result.ok:
+                self.logger.error(f"获取书库 ISBN 列表失败: {result.stderr}")
+                return None
+
+            index: Dict[str, int] = {}
+            for book_data in _loads(result.stdout):
+                isbn = (book_data.get('identifiers') or {}).get('isbn')
+                # 跳过格式无效的 ISBN，单条脏数据不影响整个索引
+                key = _norm_isbn(isbn) if isbn else ''
+                if key:
+                    index[key] = book_data.get('id', 0)
+
+            self.logger.info(f"已构建书库 ISBN 索引: {len(index)} 条")
+            return index
+
+        except Exception as e:
+            self.logger.error(f"构建书库 ISBN 索引失败: {str(e)}")
+            return None
+
+    def find_by_isbn(self, isbn: Optional[str]) -> Optional[int]:
+        """
+        通过全库 ISBN 索引精确查找书籍，索引按 _ISBN_INDEX_TTL 定期重建
+
+        未命中不代表书库中不存在（可能是索引构建后新加入的书籍，
+        或其他线程正在首次构建索引），
+        调用方应回退到 find_best_match。
+
+        Args:
+            isbn: ISBN
+
+        Returns:
+            Optional[int]: 命中时返回 calibre_id，否则返回 None
+        """
+        key = _norm_isbn(isbn) if isbn else ''
+        if not key:
+            return None
+
+        # 列出全库书籍较慢，只让一个线程在锁外重建，其他线程继续使用旧索引
+        with self._isbn_index_lock:
+            index = self._isbn_index
+            rebuild = not self._isbn_index_building and (
+                index is None or
+                time.monotonic() - self._isbn_index_built_at >= _ISBN_INDEX_TTL)
+            if rebuild:
+                self._isbn_index_building = True
+                version = self._isbn_index_version
+
+        if rebuild:
+            # 构建失败时用空索引占位，避免每次查询都重新执行 calibredb
+            index = self.build_lookup_index() or {}
+            with self._isbn_index_lock:
+                self._isbn_index_building = False
+                if version == self._isbn_index_version:
+                    self._isbn_index = index
+                    self._isbn_index_built_at = time.monotonic()
+
+        return index.get(key) if index is not None else None
+
     def get_book_info(self, book_id: int) -> Optional[Dict[str, Any]]:
         """
         获取单个书籍详细信息
@@ -302,48 +794,64 @@ class CalibreService:
         Returns:
             Optional[Dict[str, Any]]: 最佳匹配的书籍，如果没有找到则返回 None
         """
+        # 重试或回退重新排队的书籍直接复用上次的匹配结果
+        cache_key = _cache_key(title, author, isbn)
+        with self._search_cache_lock:
+            cached = self._match_cache.get(cache_key)
+            if cached is not None:
+                if time.monotonic() - cached[0] < self._book_cache_ttl:
+                    self._match_cache.move_to_end(cache_key)
+                    return cached[1]
+                # 过期条目（包括未匹配的结果）重新查询，书库可能已由其他进程更新
+                del self._match_cache[cache_key]
+
         try:
             # 搜索书籍
             books = self.search_book(title, author, isbn)
             if not books:
+                # 空结果可能来自搜索失败，不缓存
                 return None
 
-            # 计算所有结果的匹配分数，选择最高分且超过阈值的
-            best_match = None
-            best_score = 0.0
+            # 查询词集合只切分一次，在所有候选书籍间复用
+            title_tokens = _tokenize(title) if title else None
+            author_tokens = _tokenize(author) if author else None
 
+            # 每本书只计算一次匹配分数，选择最高分且超过阈值的
+            scored = []
             for book in books:
-                score = self._calculate_match_score(book, title, author, isbn)
+                score = self._calculate_match_score(book, title_tokens,
+                                                    author_tokens, isbn)
                 self.logger.debug(f"匹配评分: {book['title']} - {score:.3f}")
+                scored.append((score, book))
 
-                if score > best_score and score >= self.match_threshold:
-                    best_score = score
-                    best_match = book
+            best_score, best_match = max(scored, key=lambda item: item[0])
 
-            if best_match:
+            if best_score > 0.0 and best_score >= self.match_threshold:
                 self.logger.info(f"找到最佳匹配: {best_match['title']} "
                                  f"(匹配度: {best_score:.3f}, 阈值: {self.match_threshold})")
-            else:
-                max_score = max([self._calculate_match_score(book, title, author, isbn) for book in books]) if books else 0.0
-                self.logger.info(f"未找到满足阈值的匹配书籍 "
-                                 f"(最高匹配度: {max_score:.3f}, 阈值: {self.match_threshold})")
+                self._cache_match_result(cache_key, best_match)
+                return best_match
 
-            return best_match
+            self.logger.info(f"未找到满足阈值的匹配书籍 "
+                             f"(最高匹配度: {best_score:.3f}, 阈值: {self.match_threshold})")
+            self._cache_match_result(cache_key, None)
+            return None
 
         except Exception as e:
             self.logger.error(f"查找最佳匹配失败: {str(e)}")
             return None
 
-    def _calculate_match_score(self, book: Dict[str, Any], title: str,
-                               author: Optional[str],
+    def _calculate_match_score(self, book: Dict[str, Any],
+                               title: Union[str, FrozenSet[str], None],
+                               author: Union[str, FrozenSet[str], None],
                                isbn: Optional[str]) -> float:
         """
         计算书籍匹配分数
 
         Args:
             book: 书籍信息
-            title: 目标书名
-            author: 目标作者
+            title: 目标书名（或预先切分好的词集合）
+            author: 目标作者（或预先切分好的词集合）
             isbn: 目标ISBN
 
         Returns:
@@ -353,7 +861,14 @@ class CalibreService:
 
         # ISBN 匹配权重最高 - 如果ISBN完全匹配，直接返回高分
         if isbn and book.get('isbn'):
-            if isbn.strip() == book['isbn'].strip():
+            norm_isbn = _norm_isbn(isbn)
+            if norm_isbn:
+                isbn_match = norm_isbn == _norm_isbn(book['isbn'])
+            else:
+                # 无法归一化的 ISBN（如带 X 的 ISBN-13 或其他编号）按原始字符串比较
+                raw_isbn = isbn.strip()
+                isbn_match = bool(raw_isbn) and raw_isbn == book['isbn'].strip()
+            if isbn_match:
                 return 1.0  # ISBN匹配是最可靠的，直接返回满分
 
         # 如果没有ISBN或ISBN不匹配，基于标题和作者计算
@@ -361,41 +876,69 @@ class CalibreService:
         has_author = author and book.get('author')
 
         if has_title:
-            title_similarity = self._calculate_similarity(title, book['title'])
+            title_similarity = self._calculate_similarity(
+                title, self._get_book_tokens(book, 'title'))
             # 动态权重：如果没有作者信息，标题权重更高
             title_weight = 0.8 if not has_author else 0.7
             score += title_similarity * title_weight
 
         if has_author:
-            author_similarity = self._calculate_similarity(author, book['author'])
+            author_similarity = self._calculate_similarity(
+                author, self._get_book_tokens(book, 'author'))
             # 动态权重：如果没有标题信息，作者权重更高（理论上不会发生）
             author_weight = 0.8 if not has_title else 0.3
             score += author_similarity * author_weight
 
         return min(score, 1.0)
 
-    def _calculate_similarity(self, str1: str, str2: str) -> float:
+    def _get_book_tokens(self, book: Dict[str, Any],
+                         field: str) -> FrozenSet[str]:
+        """
+        获取书籍字段的词集合，按 (calibre_id, 字段) 缓存在独立的字典中，
+        不修改返回给调用方的书籍字典
+
+        Args:
+            book: 书籍信息
+            field: 字段名（title 或 author）
+
+        Returns:
+            FrozenSet[str]: 小写词集合
+        """
+        text = book[field]
+        key = (book.get('calibre_id'), field)
+        entry = self._token_cache.get(key)
+        if entry is not None and entry[0] == text:
+            return entry[1]
+
+        tokens = _tokenize(text)
+        if key[0] is not None:
+            if len(self._token_cache) > _BOOK_CACHE_SWEEP_SIZE:
+                self._token_cache.clear()
+            self._token_cache[key] = (text, tokens)
+        return tokens
+
+    def _calculate_similarity(self, str1: Union[str, FrozenSet[str]],
+                              str2: Union[str, FrozenSet[str]]) -> float:
         """
-        计算两个字符串的相似度
+        计算两个字符串的相似度（不区分大小写）
 
         Args:
-            str1: 第一个字符串
-            str2: 第二个字符串
+            str1: 第一个字符串（或词集合）
+            str2: 第二个字符串（或词集合）
 
         Returns:
             float: 相似度，0.0-1.0
         """
-        # 简单的 Jaccard 相似度计算
-        set1 = set(str1.split())
-        set2 = set(str2.split())
+        set1 = _tokenize(str1) if isinstance(str1, str) else str1
+        set2 = _tokenize(str2) if isinstance(str2, str) else str2
 
         if not set1 or not set2:
             return 0.0
 
-        intersection = len(set1.intersection(set2))
-        union = len(set1.union(set2))
-
-        return intersection / union if union > 0 else 0.0
+        # 以词为单位比较排好序的词序列（相当于 Dice 系数）：忽略词序，多余的词
+        # 会拉低分数；按字符比较会把不含空格的中文续集书名（如 "三体" 与
+        # "三体II"）判为高度相似
+        return _fuzz.ratio(sorted(set1), sorted(set2)) / 100.0
 
     def upload_book(
             self,
@@ -423,68 +966,53 @@ class CalibreService:
 
             # 添加元数据参数
             if metadata:
-                if metadata.get('title'):
-                    add_args.extend(['--title', metadata['title']])
-
-                if metadata.get('authors'):
-                    authors = metadata['authors']
-                    if isinstance(authors, list):
-                        authors_str = ', '.join(authors)
-                    else:
-                        authors_str = str(authors)
-                    add_args.extend(['--authors', authors_str])
-
-                if metadata.get('isbn'):
-                    add_args.extend(['--isbn', metadata['isbn']])
-
-                if metadata.get('tags'):
-                    tags = metadata['tags']
-                    if isinstance(tags, list):
-                        tags_str = ', '.join(tags)
-                    else:
-                        tags_str = str(tags)
-                    add_args.extend(['--tags', tags_str])
-
-                if metadata.get('series'):
-                    add_args.extend(['--series', metadata['series']])
-
-                if metadata.get('series_index'):
-                    add_args.extend(
-                        ['--series-index',
-                         str(metadata['series_index'])])
+                for key, flag in _ADD_SCALAR_FLAGS:
+                    value = metadata.get(key)
+                    if value:
+                        add_args += [flag, str(value)]
+
+                # 列表字段以 ', ' 连接
+                for key, flag in _ADD_LIST_FLAGS:
+                    value = metadata.get(key)
+                    if value:
+                        add_args += [
+                            flag,
+                            ', '.join(value)
+                            if isinstance(value, list) else str(value)
+                        ]
 
                 # 处理标识符
-                if metadata.get('identifiers'):
-                    identifiers = metadata['identifiers']
-                    for key, value in identifiers.items():
-                        if value:
-                            add_args.extend(['--identifier', f'{key}:{value}'])
+                for key, value in (metadata.get('identifiers') or {}).items():
+                    if value:
+                        add_args += ['--identifier', f'{key}:{value}']
 
             # 设置自动合并策略：如果存在重复，合并到现有记录
             add_args.extend(['--automerge', 'overwrite'])
 
             # 执行添加命令
-            stdout, stderr, returncode = self._execute_calibredb_command(
-                add_args)
+            result = self._execute_calibredb_command(add_args)
 
-            if returncode != 0:
-                self.logger.error(f"上传书籍失败: {stderr}")
+            if not result.ok:
+                self.logger.error(f"上传书籍失败: {result.stderr}")
                 return None
 
             # 从输出中提取书籍 ID
             # calibredb add 的输出格式通常是 "Added book ids: 123"
-            book_id = self._extract_book_id_from_add_output(stdout)
+            book_id = self._extract_book_id_from_add_output(result.stdout)
 
             if book_id:
                 self.logger.info(f"成功上传书籍: {os.path.basename(file_path)}, "
                                  f"Calibre ID: {book_id}")
 
+                # 书库已变化，缓存的搜索结果不再可靠
+                self.clear_cache()
+
                 # 检查是否需要更新 ISBN：如果上传时没有提供 ISBN，尝试从 Calibre 获取
                 self._update_isbn_if_empty(book_id, metadata)
 
                 return book_id
             else:
-                self.logger.warning(f"无法从输出中提取书籍 ID: {stdout}")
+                self.logger.warning(f"无法从输出中提取书籍 ID: {result.stdout}")
                 return None
 
         except Exception as e:
@@ -502,19 +1030,9 @@ class CalibreService:
             Optional[int]: 提取到的书籍 ID，提取失败则返回 None
         """
         try:
-            # 查找各种可能的输出格式
-            patterns = [
-                r'Added book ids?:\s*(\d+)',  # 英文: Added book ids: 123
-                r'Book id of imported book:\s*(\d+)',  # 英文: Book id of imported book: 123
-                r'已加入的书籍id:\s*(\d+)',  # 中文: 已加入的书籍id: 1420
-                r'书籍id:\s*(\d+)',  # 简化中文: 书籍id: 1420
-                r'id:\s*(\d+)',  # 更简化: id: 1420
-            ]
-
-            for pattern in patterns:
-                match = re.search(pattern, output, re.IGNORECASE)
-                if match:
-                    return int(match.group(1))
+            match = _ADD_ID_RE.search(output)
+            if match:
+                return int(match.group(1))
 
             return None
         except Exception as e:
@@ -541,6 +1059,14 @@ class CalibreService:
                 # 原始数据有 ISBN，无需更新
                 return
 
+            # 没有豆瓣 ID 时无处回写 ISBN，跳过 Calibre 查询
+            douban_id = None
+            if original_metadata and original_metadata.get('identifiers'):
+                douban_id = original_metadata['identifiers'].get('douban')
+
+            if not douban_id:
+                return
+
             # 从 Calibre 获取书籍信息
             book_info = self.get_book_info(book_id)
             if not book_info:
@@ -564,15 +1090,10 @@ class CalibreService:
                 self.logger.debug(f"Calibre 中也没有 ISBN 信息: {book_id}")
                 return
 
-            # 获取豆瓣书籍信息并更新 ISBN
-            douban_id = None
-            if original_metadata and original_metadata.get('identifiers'):
-                douban_id = original_metadata['identifiers'].get('douban')
-
-            if douban_id:
-                self._update_douban_book_isbn(douban_id, calibre_isbn)
-                self.logger.info(
-                    f"已从 Calibre 更新豆瓣书籍 ISBN: {douban_id} -> {calibre_isbn}")
+            # 更新豆瓣书籍 ISBN
+            self._update_douban_book_isbn(douban_id, calibre_isbn)
+            self.logger.info(
+                f"已从 Calibre 更新豆瓣书籍 ISBN: {douban_id} -> {calibre_isbn}")
 
         except Exception as e:
             self.logger.error(f"更新 ISBN 时出错: {str(e)}")
@@ -610,14 +1131,14 @@ class CalibreService:
                 str(book_id), '--field', f'isbn:{isbn}'
             ]
 
-            stdout, stderr, returncode = self._execute_calibredb_command(
-                set_args)
+            result = self._execute_calibredb_command(set_args)
 
-            if returncode != 0:
-                self.logger.error(f"更新 ISBN 失败: {stderr}")
+            if not result.ok:
+                self.logger.error(f"更新 ISBN 失败: {result.stderr}")
                 return False
 
             self.logger.info(f"成功更新书籍 ISBN: ID={book_id}, ISBN={isbn}")
+            self.clear_cache()
             return True
 
         except Exception as e:
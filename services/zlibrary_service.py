@@ -5,52 +5,299 @@ Z-Library 服务
 分离搜索和下载功能，提供更好的错误处理。
 """
 
-import nest_asyncio
-
-nest_asyncio.apply()
-
 import asyncio
-import difflib
+import errno
 import json
 import os
 import random
 import re
+import shutil
+import threading
 import time
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote as _url_unquote
 
 import requests
 import zlibrary
+from rapidfuzz import fuzz as _fuzz
+from rapidfuzz import process as _process
+from requests.adapters import HTTPAdapter
 
 from core.pipeline import NetworkError, ProcessingError, ResourceNotFoundError
 from utils.logger import get_logger
 
+# orjson 为可选依赖，缺失时回退到标准库 json
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+
+    def _dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+# 相似度计算使用的正则
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_YEAR_RE = re.compile(r'\d{4}')
+_NON_DIGIT_RE = re.compile(r'[^\d]')
+# ISBN 中常见的分隔符，str.translate 删除后通常即为纯数字
+_ISBN_SEPARATORS = str.maketrans('', '', '- ')
+
+# 搜索结果详情的最大并发请求数
+_FETCH_CONCURRENCY = 5
+
+# 连续错误 n 次时的延迟倍数 min(1.5**n, 4.0)，预先计算
+_ERROR_MULTIPLIERS = tuple(min(1.5**i, 4.0) for i in range(32))
+
+# 搜索结果字段映射：(输出字段, 原始字段, 默认值)
+_RESULT_FIELD_MAP = (
+    ('zlibrary_id', 'id', None),
+    ('title', 'name', None),
+    ('size', 'size', None),
+    ('isbn', 'isbn', ''),
+    ('url', 'url', ''),
+    ('cover', 'cover', ''),
+    ('description', 'description', ''),
+    ('edition', 'edition', ''),
+    ('categories', 'categories', ''),
+    ('categories_url', 'categories_url', ''),
+    ('download_url', 'download_url', ''),
+    ('publisher', 'publisher', ''),
+    ('year', 'year', ''),
+    ('language', 'language', ''),
+    ('rating', 'rating', ''),
+    ('quality', 'quality', ''),
+)
+
+
+def dump_raw_json(book_info: Dict[str, Any]) -> str:
+    """
+    将搜索结果中的原始数据序列化为JSON字符串
+
+    Args:
+        book_info: _process_search_results 返回的书籍信息字典
+
+    Returns:
+        str: 原始数据的JSON字符串，没有原始数据时返回 '{}'
+    """
+    raw = book_info.get('raw')
+    if raw is None:
+        return book_info.get('raw_json', '{}')
+    return _dumps(raw)
+
+
+class _EventLoopThread:
+    """在后台线程中持续运行的事件循环，供同步代码提交协程执行"""
+
+    def __init__(self, name: str):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name=name,
+                                        daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        在事件循环中执行协程并阻塞等待结果（可从除事件循环线程外的任意线程调用）
+
+        Args:
+            coro: 要执行的协程
+            timeout: 等待超时时间（秒），None 表示一直等待
+
+        Raises:
+            TimeoutError: 超时，协程已被取消
+        """
+        if threading.current_thread() is self._thread:
+            # 在事件循环线程内同步等待自身会死锁
+            coro.close()
+            raise RuntimeError("不能在事件循环线程内同步执行协程，请直接 await")
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def run_async(self, coro):
+        """在事件循环中执行协程，供其他事件循环中的协程 await 而不阻塞"""
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def close(self):
+        """停止并关闭事件循环"""
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def _clean_isbn(isbn: str) -> str:
+    """移除ISBN中的非数字字符"""
+    cleaned = isbn.translate(_ISBN_SEPARATORS)
+    if cleaned.isdigit():
+        return cleaned
+    # 含有其他字符（如 ISBN-10 的校验位X）时回退到正则
+    return _NON_DIGIT_RE.sub('', cleaned)
+
+
+@lru_cache(maxsize=1024)
+def _parse_year(date_str: str) -> Optional[int]:
+    """
+    从日期字符串中提取年份
+
+    Args:
+        date_str: 日期字符串，如 '2019-06-01'、'2019年6月'
+
+    Returns:
+        Optional[int]: 年份，无法提取时返回None
+    """
+    if not isinstance(date_str, str):
+        return None
+    # 常见格式以年份开头时无需正则
+    if date_str[:4].isdigit():
+        return int(date_str[:4])
+    match = _YEAR_RE.search(date_str)
+    return int(match.group()) if match else None
 
-class ZLibrarySearchService:
-    """Z-Library搜索服务 - 专门负责搜索功能"""
+
+@lru_cache(maxsize=4096)
+def _normalize_text(text: str) -> str:
+    """预处理文本：转换为小写，移除标点符号和多余空格"""
+    return _PUNCT_RE.sub(' ', text.lower()).strip()
+
+
+class ZLibraryClient:
+    """共享的 Z-Library 客户端 - 持有登录后的 AsyncZlib 实例和事件循环"""
 
     def __init__(self,
                  email: str,
                  password: str,
-                 proxy_list: List[str] = None,
+                 proxy_list: List[str] = None):
+        """
+        初始化客户端（延迟登录）
+
+        Args:
+            email: Z-Library 账号
+            password: 密码
+            proxy_list: 代理列表
+        """
+        self.logger = get_logger("zlibrary_client")
+        self.__email = email
+        self.__password = password
+        self.proxy_list = proxy_list or []
+
+        # 客户端实例
+        self.lib = None
+        self._connected = False
+        self._login_lock = threading.Lock()
+
+        # 持久事件循环，替代每次调用 asyncio.run 新建/销毁事件循环
+        self._loop_thread = _EventLoopThread("zlibrary-loop")
+
+    @property
+    def cookies(self) -> Dict[str, str]:
+        """登录后的 cookies，未登录时为空字典"""
+        return self.lib.cookies if self.lib else {}
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """在客户端的持久事件循环中执行协程"""
+        return self._loop_thread.run(coro, timeout)
+
+    async def run_async(self, coro):
+        """在客户端的事件循环中执行协程（供其他事件循环 await）"""
+        return await self._loop_thread.run_async(coro)
+
+    def close(self):
+        """关闭客户端的事件循环，之后不能再执行协程"""
+        self._connected = False
+        self.lib = None
+        self._loop_thread.close()
+
+    def ensure_connected(self) -> bool:
+        """确保客户端已连接，支持重试机制"""
+        # 快速路径：已登录时直接返回
+        if self._connected and self.lib is not None:
+            return True
+
+        # 多个线程同时调用时只登录一次
+        with self._login_lock:
+            if self._connected and self.lib is not None:
+                return True
+            return self._login()
+
+    def _login(self) -> bool:
+        """登录 Z-Library，失败时指数退避重试（调用方需持有 _login_lock）"""
+        max_retries = 3
+        base_delay = 2.0
+
+        for attempt in range(1, max_retries + 1):
+            try:
+                if self.lib is None:
+                    self.logger.info(
+                        f'开始登陆Zlibrary (尝试 {attempt}/{max_retries})')
+                    self.lib = zlibrary.AsyncZlib(proxy_list=self.proxy_list)
+                    # Login first - zlibrary will assign personal domain
+                    self.run(self.lib.login(self.__email, self.__password))
+                    self.logger.info('Zlibrary登录成功')
+                    # Log the domain assigned after login (should be personal subdomain)
+                    self.logger.info(f'Personal domain after login: {self.lib.domain}')
+                    self.logger.info(f'Mirror: {self.lib.mirror if hasattr(self.lib, "mirror") else "N/A"}')
+                # 无论是新创建连接还是已有连接，都应该返回True
+                self._connected = True
+                return True
+
+            except Exception as e:
+                error_msg = str(e)
+
+                if attempt < max_retries:
+                    retry_delay = base_delay * (2**(attempt - 1))  # 指数退避
+                    self.logger.warning(
+                        f"Z-Library连接失败，{retry_delay}秒后重试第{attempt + 1}次: {error_msg}"
+                    )
+                    time.sleep(retry_delay)
+                    # 重置lib以便下次重新连接
+                    self.lib = None
+                    continue
+                else:
+                    self.lib = None
+                    self.logger.error(
+                        f"Z-Library连接失败，已重试{max_retries}次: {error_msg}")
+                    raise NetworkError(
+                        f"Z-Library连接失败（重试{max_retries}次后失败）: {error_msg}")
+
+        return False
+
+    def invalidate_connection(self):
+        """标记连接失效，下次 ensure_connected 时重新登录"""
+        self._connected = False
+        self.lib = None
+
+
+class ZLibrarySearchService:
+    """Z-Library搜索服务 - 专门负责搜索功能"""
+
+    def __init__(self,
+                 client: 'ZLibraryClient',
                  min_delay: float = 1.0,
                  max_delay: float = 3.0):
         """
         初始化搜索服务
         
         Args:
-            email: Z-Library 账号
-            password: 密码
-            proxy_list: 代理列表
+            client: 共享的 Z-Library 客户端
             min_delay: 最小延迟时间（秒）
             max_delay: 最大延迟时间（秒）
         """
         self.logger = get_logger("zlibrary_search")
-        self.__email = email
-        self.__password = password
-        self.proxy_list = proxy_list or []
+        self.client = client
         self.min_delay = min_delay
         self.max_delay = max_delay
 
@@ -58,8 +305,11 @@ class ZLibrarySearchService:
         self.consecutive_errors = 0
         self.request_count = 0
 
-        # 客户端实例
-        self.lib = None
+        # 搜索结果缓存：归一化查询 -> (写入时间, 结果)，LRU 淘汰
+        self._search_cache: OrderedDict = OrderedDict()
+        self._search_cache_max = 256
+        self._search_cache_ttl = 3600
+        self._search_cache_lock = threading.Lock()
 
         # 不在初始化时立即连接，改为延迟连接
         # self.ensure_connected()
@@ -97,46 +347,22 @@ class ZLibrarySearchService:
 
         self.ensure_connected()
 
-    def ensure_connected(self) -> bool:
-        """确保客户端已连接，支持重试机制"""
-        max_retries = 3
-        base_delay = 2.0
+    @property
+    def lib(self):
+        """共享客户端中已登录的 AsyncZlib 实例（未登录时为None）"""
+        return self.client.lib
 
-        for attempt in range(1, max_retries + 1):
-            try:
-                if self.lib is None:
-                    self.logger.info(
-                        f'开始登陆Zlibrary (尝试 {attempt}/{max_retries})')
-                    self.lib = zlibrary.AsyncZlib(proxy_list=self.proxy_list)
-                    # Login first - zlibrary will assign personal domain
-                    asyncio.run(self.lib.login(self.__email, self.__password))
-                    self.logger.info('Zlibrary登录成功')
-                    # Log the domain assigned after login (should be personal subdomain)
-                    self.logger.info(f'Personal domain after login: {self.lib.domain}')
-                    self.logger.info(f'Mirror: {self.lib.mirror if hasattr(self.lib, "mirror") else "N/A"}')
-                # 无论是新创建连接还是已有连接，都应该返回True
-                return True
-
-            except Exception as e:
-                error_msg = str(e)
-                self.consecutive_errors += 1
+    def ensure_connected(self) -> bool:
+        """确保共享客户端已登录"""
+        return self.client.ensure_connected()
 
-                if attempt < max_retries:
-                    retry_delay = base_delay * (2**(attempt - 1))  # 指数退避
-                    self.logger.warning(
-                        f"Z-Library连接失败，{retry_delay}秒后重试第{attempt + 1}次: {error_msg}"
-                    )
-                    time.sleep(retry_delay)
-                    # 重置lib以便下次重新连接
-                    self.lib = None
-                    continue
-                else:
-                    self.logger.error(
-                        f"Z-Library连接失败，已重试{max_retries}次: {error_msg}")
-                    raise NetworkError(
-                        f"Z-Library连接失败（重试{max_retries}次后失败）: {error_msg}")
+    def invalidate_connection(self):
+        """标记连接失效，下次 ensure_connected 时重新登录"""
+        self.client.invalidate_connection()
 
-        return False
+    def _run_async(self, coro):
+        """在共享客户端的事件循环中执行协程"""
+        return self.client.run(coro)
 
     def search_books(self,
                      title: str = None,
@@ -155,6 +381,13 @@ class ZLibrarySearchService:
         Returns:
             List[Dict[str, Any]]: 搜索结果列表
         """
+        cache_key = tuple((v or '').strip().lower()
+                          for v in (title, author, isbn, publisher))
+        cached = self._get_cached_search(cache_key)
+        if cached is not None:
+            self.logger.debug("命中搜索缓存: %s", cache_key)
+            return cached
+
         self.logger.info(
             f"开始渐进式搜索: 书名='{title}', 作者='{author}', ISBN='{isbn}', 出版社='{publisher}'"
         )
@@ -174,6 +407,7 @@ class ZLibrarySearchService:
                 results = self._execute_search_strategy(strategy)
                 if results:
                     self.consecutive_errors = 0  # 重置错误计数
+                    self._cache_search_result(cache_key, results)
                     return results
 
             except (NetworkError, asyncio.TimeoutError) as e:
@@ -210,6 +444,50 @@ class ZLibrarySearchService:
             self.logger.warning("所有搜索策略都未找到结果")
             raise ResourceNotFoundError("未找到匹配的书籍")
 
+    def _get_cached_search(
+            self, cache_key: Tuple[str, ...]) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取未过期的搜索缓存
+
+        Args:
+            cache_key: (书名, 作者, ISBN, 出版社) 归一化后的缓存键
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: 结果副本，未命中或已过期时返回None
+        """
+        with self._search_cache_lock:
+            entry = self._search_cache.get(cache_key)
+            if entry is None:
+                return None
+            cached_at, results = entry
+            if time.monotonic() - cached_at >= self._search_cache_ttl:
+                del self._search_cache[cache_key]
+                return None
+            self._search_cache.move_to_end(cache_key)
+        # 返回副本，避免调用方修改缓存内容
+        return [dict(r) for r in results]
+
+    def _cache_search_result(self, cache_key: Tuple[str, ...],
+                             results: List[Dict[str, Any]]) -> None:
+        """
+        写入搜索缓存，超过容量时淘汰最久未使用的条目
+
+        Args:
+            cache_key: (书名, 作者, ISBN, 出版社) 归一化后的缓存键
+            results: 搜索结果
+        """
+        with self._search_cache_lock:
+            self._search_cache[cache_key] = (time.monotonic(),
+                                             [dict(r) for r in results])
+            self._search_cache.move_to_end(cache_key)
+            while len(self._search_cache) > self._search_cache_max:
+                self._search_cache.popitem(last=False)
+
+    def clear_cache(self) -> None:
+        """清空搜索结果缓存"""
+        with self._search_cache_lock:
+            self._search_cache.clear()
+
     def _get_applicable_strategies(self, title: str, author: str, isbn: str,
                                    publisher: str) -> List[Dict[str, Any]]:
         """获取适用的搜索策略"""
@@ -227,29 +505,32 @@ class ZLibrarySearchService:
         return applicable_strategies
 
     async def _async_search_books(self, q, count: int = 10):
-        # 确保已连接和登录（使用同步方法确保重试机制）
-        if not self.ensure_connected():
+        # 连接和登录由调用方通过 ensure_connected 保证；
+        # 这里运行在事件循环线程中，不能再同步等待登录
+        if self.lib is None:
             raise NetworkError("无法连接到Z-Library服务")
 
         paginator = await self.lib.search(q=q)
         await paginator.next()
 
-        books_info = []
-        for res in paginator.result:
-            zlib_id = res.get('id')
-            _book = await res.fetch()
+        # 并发获取详情，用信号量限制并发数以免触发限流
+        semaphore = asyncio.Semaphore(_FETCH_CONCURRENCY)
+
+        async def _fetch(res):
+            async with semaphore:
+                _book = await res.fetch()
             if 'id' not in _book:
-                _book['id'] = zlib_id
-            books_info.append(_book)
-            # # TODO:
-            # return books_info
-        return books_info
+                _book['id'] = res.get('id')
+            return _book
+
+        return list(await asyncio.gather(*(_fetch(res)
+                                           for res in paginator.result)))
 
     def _execute_search_strategy(
             self, strategy: Dict[str, Any]) -> List[Dict[str, Any]]:
         """执行单个搜索策略，包含重试机制"""
-        self.logger.info(f"尝试策略 {strategy['priority']}: {strategy['name']}")
-        self.logger.info(f"搜索查询: {strategy['query']}")
+        self.logger.info("尝试策略 %s: %s，搜索查询: %s", strategy['priority'],
+                         strategy['name'], strategy['query'])
 
         max_retries = 3
         base_delay = 2.0
@@ -265,7 +546,7 @@ class ZLibrarySearchService:
                 self.request_count += 1
 
                 # 执行搜索
-                first_set = asyncio.run(
+                first_set = self._run_async(
                     self._async_search_books(strategy['query']))
 
                 # 搜索成功，重置错误计数
@@ -302,7 +583,7 @@ class ZLibrarySearchService:
             raise NetworkError("搜索重试次数用完")
 
         if not first_set:
-            self.logger.info(f"搜索无结果")
+            self.logger.info("搜索无结果")
             return []
 
         # 处理结果
@@ -314,42 +595,35 @@ class ZLibrarySearchService:
         return processed_results
 
     def _process_authors(self, author_info):
+        """将作者信息（字符串/字典/字典列表）统一为以 ';;' 分隔的字符串"""
         if isinstance(author_info, str):
             return author_info
+        if isinstance(author_info, dict):
+            return author_info.get('author', '')
         if isinstance(author_info, list):
             return ";;".join(
-                [self._process_authors(_info) for _info in author_info])
-        if isinstance(author_info, dict):
-            return author_info['author']
+                _info if isinstance(_info, str) else
+                _info.get('author', '') if isinstance(_info, dict) else ''
+                for _info in author_info)
+        return ''
 
     def _process_search_results(self,
                                 results: List[Any]) -> List[Dict[str, Any]]:
         """处理搜索结果"""
         processed_results = []
 
-        for i, result in enumerate(results):
+        for result in results:
             # 提取书籍信息
             book_info = {
-                'zlibrary_id': result.get('id'),
-                'title': result.get('name'),
-                'authors': self._process_authors(result.get('authors', '')),
-                'extension': result.get('extension', '').lower(),
-                'size': result.get('size'),
-                'isbn': result.get('isbn', ''),
-                'url': result.get('url', ''),
-                'cover': result.get('cover', ''),
-                'description': result.get('description', ''),
-                'edition': result.get('edition', ''),
-                'categories': result.get('categories', ''),
-                'categories_url': result.get('categories_url', ''),
-                'download_url': result.get('download_url', ''),
-                'publisher': result.get('publisher', ''),
-                'year': result.get('year', ''),
-                'language': result.get('language', ''),
-                'rating': result.get('rating', ''),
-                'quality': result.get('quality', ''),
-                'raw_json': json.dumps(result, ensure_ascii=False)
+                out: result.get(src, default)
+                for out, src, default in _RESULT_FIELD_MAP
             }
+            # 需要转换的字段
+            book_info['authors'] = self._process_authors(
+                result.get('authors', ''))
+            book_info['extension'] = result.get('extension', '').lower()
+            # 原始数据在需要时再通过 dump_raw_json 序列化
+            book_info['raw'] = result
 
             processed_results.append(book_info)
 
@@ -367,6 +641,12 @@ class ZLibrarySearchService:
         Returns:
             float: 匹配度得分，范围0.0-1.0
         """
+        # ISBN完全一致是最强的匹配信号，直接视为完全匹配，跳过文本相似度计算
+        isbn_score = self._calculate_isbn_similarity(
+            douban_book.get('isbn', ''), zlibrary_book.get('isbn', ''))
+        if isbn_score == 1.0:
+            return 1.0
+
         score = 0.0
 
         # 1. 书名相似度 (权重: 0.4)
@@ -392,66 +672,123 @@ class ZLibrarySearchService:
             douban_book.get('publish_date', ''), zlibrary_book.get('year', ''))
         score += year_score * 0.1
 
-        # 5. ISBN完全匹配奖励 (权重: 0.05)
-        isbn_score = self._calculate_isbn_similarity(
-            douban_book.get('isbn', ''), zlibrary_book.get('isbn', ''))
+        # 5. ISBN完全匹配奖励 (权重: 0.05)，完全匹配已在开头直接返回
         score += isbn_score * 0.05
 
         return min(1.0, score)  # 确保不超过1.0
 
-    def _calculate_text_similarity(self, text1: str, text2: str) -> float:
+    def rank_candidates(self, douban_book: Dict[str, str],
+                        zlibrary_books: List[Dict[str, Any]]) -> List[float]:
+        """
+        批量计算一本豆瓣书籍与多个Z-Library候选的匹配度得分
+        
+        权重与 calculate_match_score 一致，书名/作者/出版社相似度
+        各通过一次 rapidfuzz cdist 调用批量计算。
+        
+        Args:
+            douban_book: 豆瓣书籍信息字典
+            zlibrary_books: Z-Library书籍信息字典列表
+            
+        Returns:
+            List[float]: 与 zlibrary_books 顺序一致的匹配度得分
+        """
+        title_scores = self._batch_text_similarity(
+            douban_book.get('title', ''),
+            [b.get('title', '') for b in zlibrary_books])
+        author_scores = self._batch_text_similarity(
+            douban_book.get('author', ''),
+            [b.get('authors', '').replace(';;', ' ') for b in zlibrary_books])
+        publisher_scores = self._batch_text_similarity(
+            douban_book.get('publisher', ''),
+            [b.get('publisher', '') for b in zlibrary_books])
+
+        publish_date = douban_book.get('publish_date', '')
+        isbn = douban_book.get('isbn', '')
+
+        scores = []
+        for i, zlibrary_book in enumerate(zlibrary_books):
+            # ISBN完全一致时直接视为完全匹配，与 calculate_match_score 一致
+            if self._calculate_isbn_similarity(
+                    isbn, zlibrary_book.get('isbn', '')) == 1.0:
+                scores.append(1.0)
+                continue
+            score = (title_scores[i] * 0.4 + author_scores[i] * 0.3 +
+                     publisher_scores[i] * 0.15 +
+                     self._calculate_year_similarity(
+                         publish_date, zlibrary_book.get('year', '')) * 0.1)
+            scores.append(min(1.0, score))
+
+        return scores
+
+    @staticmethod
+    def _batch_text_similarity(text: str, candidates: List[str]) -> List[float]:
+        """使用 rapidfuzz.process.cdist 计算一个文本与多个候选文本的相似度"""
+        if not text:
+            return [0.0] * len(candidates)
+
+        normalized = [_normalize_text(c) if c else '' for c in candidates]
+        row = _process.cdist([_normalize_text(text)],
+                             normalized,
+                             scorer=_fuzz.ratio)[0]
+
+        return [
+            float(score) / 100.0 if candidate else 0.0
+            for score, candidate in zip(row, candidates)
+        ]
+
+    # 以下相似度计算不依赖实例状态，定义为带 LRU 缓存的静态方法，
+    # 同一组字符串在多次排序/重试中只计算一次
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _calculate_text_similarity(text1: str, text2: str) -> float:
         """计算两个文本的相似度"""
         if not text1 or not text2:
             return 0.0
 
         # 预处理：转换为小写，移除标点符号和多余空格
-        text1 = re.sub(r'[^\w\s]', ' ', text1.lower()).strip()
-        text2 = re.sub(r'[^\w\s]', ' ', text2.lower()).strip()
+        text1 = _normalize_text(text1)
+        text2 = _normalize_text(text2)
 
         if text1 == text2:
             return 1.0
 
-        # 使用difflib计算序列相似度
-        similarity = difflib.SequenceMatcher(None, text1, text2).ratio()
-        return similarity
+        return _fuzz.ratio(text1, text2) / 100.0
 
-    def _calculate_year_similarity(self, date_str: str,
-                                   year_str: str) -> float:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _calculate_year_similarity(date_str: str, year_str: str) -> float:
         """计算年份相似度"""
         if not date_str or not year_str:
             return 0.0
 
-        try:
-            # 从日期字符串中提取年份
-            douban_year = re.search(r'\d{4}', date_str)
-            if douban_year:
-                douban_year = int(douban_year.group())
-                zlibrary_year = int(year_str)
-
-                # 年份完全匹配
-                if douban_year == zlibrary_year:
-                    return 1.0
-                # 年份相差1年内
-                elif abs(douban_year - zlibrary_year) <= 1:
-                    return 0.8
-                # 年份相差2年内
-                elif abs(douban_year - zlibrary_year) <= 2:
-                    return 0.6
-                else:
-                    return 0.0
-        except (ValueError, AttributeError):
+        douban_year = _parse_year(date_str)
+        year_str = str(year_str).strip()
+        if douban_year is None or not year_str.isdigit():
             return 0.0
 
+        diff = abs(douban_year - int(year_str))
+        # 年份完全匹配
+        if diff == 0:
+            return 1.0
+        # 年份相差1年内
+        if diff <= 1:
+            return 0.8
+        # 年份相差2年内
+        if diff <= 2:
+            return 0.6
         return 0.0
 
-    def _calculate_isbn_similarity(self, isbn1: str, isbn2: str) -> float:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _calculate_isbn_similarity(isbn1: str, isbn2: str) -> float:
         """计算ISBN相似度"""
         if not isbn1 or not isbn2:
             return 0.0
 
         # 移除ISBN中的非数字字符
-        isbn1_clean = re.sub(r'[^\d]', '', isbn1)
-        isbn2_clean = re.sub(r'[^\d]', '', isbn2)
+        isbn1_clean = _clean_isbn(isbn1)
+        isbn2_clean = _clean_isbn(isbn2)
 
         if isbn1_clean and isbn2_clean and isbn1_clean == isbn2_clean:
             return 1.0
@@ -510,23 +847,144 @@ class ZLibrarySearchService:
 
         # 根据连续错误增加延迟
         if self.consecutive_errors > 0:
-            error_multiplier = min(1.5**self.consecutive_errors, 4.0)
+            error_multiplier = _ERROR_MULTIPLIERS[min(
+                self.consecutive_errors, len(_ERROR_MULTIPLIERS) - 1)]
             min_delay *= error_multiplier
             max_delay *= error_multiplier
 
         # 执行延迟
         delay = random.uniform(min_delay, max_delay)
-        self.logger.debug(f"延迟 {delay:.2f} 秒")
+        self.logger.debug("延迟 %.2f 秒", delay)
         time.sleep(delay)
 
 
+# 下载时每次读取/写入的块大小
+_DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# 不小于此大小且服务器支持 Range 时并发分段下载
+_RANGED_MIN_SIZE = 16 * 1024 * 1024
+_RANGED_PARTS = 4
+_RANGED_READ_SIZE = 64 * 1024
+
+# 每个下载会话的连接池大小：4 个并发下载 × 每个最多 _RANGED_PARTS 个分段
+_POOL_MAXSIZE = 4 * _RANGED_PARTS
+
+# 低于此值（秒）的限速等待直接跳过
+_MIN_SLEEP = 0.05
+
+# 下载请求与出错后的最小延迟区间下限（秒）
+_DOWNLOAD_DELAY_MIN = 3.0
+_DOWNLOAD_DELAY_MAX = 6.0
+_ERROR_DELAY_MIN = 5.0
+_ERROR_DELAY_MAX = 10.0
+
+# 获取下载限制的超时时间（秒）
+_LIMITS_TIMEOUT = 30.0
+
+# 文件名中的非法字符统一替换为下划线；非法字符均为 ASCII，而 UTF-8 多字节
+# 序列的每个字节都 >= 0x80，因此可以安全地在字节层面用 256 字节查找表替换
+_ILLEGAL_FILENAME_TABLE = bytes.maketrans(b'/\\:*?"<>|', b'_________')
+
+
+def _parse_content_disposition_filename(
+        content_disposition: str) -> Optional[str]:
+    """
+    单次遍历解析 Content-Disposition 头中的文件名
+
+    按分号切分参数，优先使用 RFC 5987 的 filename*=charset'lang'value，
+    其次是 filename="xxx" 或 filename=xxx。
+
+    Args:
+        content_disposition: Content-Disposition 头的值
+
+    Returns:
+        Optional[str]: 文件名，不存在时返回 None
+    """
+    plain = None
+    for part in content_disposition.split(';'):
+        key, sep, value = part.partition('=')
+        if not sep:
+            continue
+        key = key.strip().lower()
+        if key == 'filename*':
+            charset, _, rest = value.strip().partition("'")
+            _, _, encoded = rest.partition("'")
+            if encoded:
+                try:
+                    filename = _url_unquote(encoded.strip('"'),
+                                            encoding=charset or 'utf-8',
+                                            errors='replace')
+                except LookupError:
+                    filename = None
+                if filename:
+                    return filename
+        elif key == 'filename' and plain is None:
+            plain = value.strip().strip('"\'').strip() or None
+    return plain
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """
+    为即将写入的文件预留磁盘空间
+
+    优先使用 posix_fallocate 一次性分配连续的磁盘块：空间不足时在下载开始前
+    立即失败，并发分段写入也不会产生碎片。不支持时退回 ftruncate（稀疏文件）。
+
+    Args:
+        fd: 以可写方式打开的文件描述符
+        size: 文件大小（字节）
+
+    Raises:
+        OSError: 磁盘空间不足
+    """
+    if size <= 0:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    os.ftruncate(fd, size)
+
+
+class _ProgressWriter:
+    """包装文件对象，统计写入字节数并定期打印下载进度"""
+
+    def __init__(self, file, total_size: int,
+                 interval: int = 4 * 1024 * 1024):
+        self._file = file
+        self._interval = interval
+        self._next_report = interval
+        self.total_size = total_size
+        self.written = 0
+
+    def write(self, data) -> int:
+        # 目标文件为无缓冲的原始文件对象，单次写入可能不完整，需循环写完
+        view = memoryview(data)
+        while view:
+            view = view[self._file.write(view):]
+        written = len(data)
+        self.written += written
+
+        # Print progress every 4MB
+        if self.total_size > 0 and self.written >= self._next_report:
+            self._next_report += self._interval
+            percent = (self.written / self.total_size) * 100
+            downloaded_mb = self.written / (1024 * 1024)
+            total_mb = self.total_size / (1024 * 1024)
+            # Print with carriage return to overwrite previous line
+            print(f"\r⬇️  Progress: {percent:.1f}% ({downloaded_mb:.1f}/{total_mb:.1f} MB)", end='', flush=True)
+
+        return written
+
+
 class ZLibraryDownloadService:
     """Z-Library下载服务 - 专门负责下载功能"""
 
     def __init__(self,
-                 email: str,
-                 password: str,
-                 proxy_list: List[str] = None,
+                 client: 'ZLibraryClient',
                  format_priority: List[str] = None,
                  min_delay: float = 2.0,
                  max_delay: float = 5.0,
@@ -535,18 +993,15 @@ class ZLibraryDownloadService:
         初始化下载服务
         
         Args:
-            email: Z-Library 账号
-            password: 密码
-            proxy_list: 代理列表
+            client: 共享的 Z-Library 客户端
             format_priority: 格式优先级
             min_delay: 最小延迟时间（秒）
             max_delay: 最大延迟时间（秒）
             max_retries: 最大重试次数
         """
         self.logger = get_logger("zlibrary_download")
-        self.__email = email
-        self.__password = password
-        self.proxy_list = proxy_list or []
+        self.client = client
+        self.proxy_list = client.proxy_list
         self.format_priority = format_priority or ['epub', 'mobi', 'pdf']
         self.min_delay = min_delay
         self.max_delay = max_delay
@@ -556,48 +1011,134 @@ class ZLibraryDownloadService:
         self.consecutive_errors = 0
         self.request_count = 0
 
-        # 客户端实例
-        self.lib = None
+        # 下载使用的HTTP会话，跨重试和书籍复用连接池与TLS连接
+        self._session = self._create_session()
 
-    def ensure_connected(self) -> bool:
-        """确保客户端已连接，支持重试机制"""
-        max_retries = 3
-        base_delay = 2.0
+        # 每个代理一个会话，保持到各代理的连接可复用；
+        # 按代理分别限速：代理地址（直连为None） -> 下次允许请求的时间
+        self._proxy_sessions: Dict[str, requests.Session] = {}
+        self._proxy_next_allowed: Dict[Optional[str], float] = {}
+        self._proxy_lock = threading.Lock()
 
-        for attempt in range(1, max_retries + 1):
-            try:
-                if self.lib is None:
-                    self.logger.info(
-                        f'开始登陆Zlibrary (尝试 {attempt}/{max_retries})')
-                    self.lib = zlibrary.AsyncZlib(proxy_list=self.proxy_list)
-                    # Login first - zlibrary will assign personal domain
-                    asyncio.run(self.lib.login(self.__email, self.__password))
-                    self.logger.info('Zlibrary登录成功')
-                    # Log the domain assigned after login
-                    self.logger.info(f'Personal domain after login: {self.lib.domain}')
-                # 无论是新创建连接还是已有连接，都应该返回True
-                return True
+        # 最近一次使用的 cookies 及其序列化后的 Cookie 头
+        self._cookie_cache: Tuple[Dict[str, str], str] = ({}, '')
 
-            except Exception as e:
-                error_msg = str(e)
-                self.consecutive_errors += 1
+    @staticmethod
+    def _create_session(proxy_url: str = None) -> requests.Session:
+        """
+        创建下载用的HTTP会话
 
-                if attempt < max_retries:
-                    retry_delay = base_delay * (2**(attempt - 1))  # 指数退避
-                    self.logger.warning(
-                        f"Z-Library连接失败，{retry_delay}秒后重试第{attempt + 1}次: {error_msg}"
-                    )
-                    time.sleep(retry_delay)
-                    # 重置lib以便下次重新连接
-                    self.lib = None
-                    continue
-                else:
-                    self.logger.error(
-                        f"Z-Library连接失败，已重试{max_retries}次: {error_msg}")
-                    raise NetworkError(
-                        f"Z-Library连接失败（重试{max_retries}次后失败）: {error_msg}")
+        Args:
+            proxy_url: 代理地址（可选），设置后该会话的所有请求都走此代理
 
-        return False
+        Returns:
+            requests.Session: 配置好连接池和请求头的会话
+        """
+        session = requests.Session()
+        # 多个工作线程并发下载且每个下载最多 _RANGED_PARTS 个
+        # 分段连接时，池需足够大，否则用完的 keep-alive 连接会被丢弃而无法复用
+        adapter = HTTPAdapter(pool_connections=4,
+                              pool_maxsize=_POOL_MAXSIZE,
+                              max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'User-Agent':
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        })
+        if proxy_url:
+            session.proxies = {'http': proxy_url, 'https': proxy_url}
+        return session
+
+    def close(self):
+        """关闭所有下载用的HTTP会话"""
+        self._session.close()
+        with self._proxy_lock:
+            for session in self._proxy_sessions.values():
+                session.close()
+            self._proxy_sessions.clear()
+
+    def _cookie_header(self, cookies: Dict[str, str]) -> str:
+        """
+        将 cookies 序列化为 Cookie 请求头，cookies 未变化时复用上次的结果
+
+        Args:
+            cookies: cookie 字典
+
+        Returns:
+            str: Cookie 请求头的值
+        """
+        cached_cookies, header = self._cookie_cache
+        if cookies == cached_cookies:
+            return header
+
+        header = "; ".join(
+            [f"{k}={v}" for k, v in cookies.items()] +
+            ["switchLanguage=zh", "siteLanguage=zh"])
+        self._cookie_cache = (dict(cookies), header)
+        return header
+
+    def _acquire_session(
+            self,
+            request_type: str = "download"
+    ) -> Tuple[requests.Session, Optional[str]]:
+        """
+        选择最早可用的代理并按其限速等待，返回对应的会话
+
+        每个代理（未配置代理时为直连）各自记录下次允许请求的时间，
+        多个代理之间的等待互不影响。
+
+        Args:
+            request_type: 请求类型，用于计算延迟
+
+        Returns:
+            Tuple[requests.Session, Optional[str]]: (会话, 代理地址)，未配置代理时代理地址为None
+        """
+        delay = self._compute_delay(request_type=request_type)
+
+        with self._proxy_lock:
+            if self.proxy_list:
+                # 多个代理同时可用时 min 取列表中靠前者，效果等同轮询
+                proxy_url = min(
+                    self.proxy_list,
+                    key=lambda p: self._proxy_next_allowed.get(p, 0.0))
+            else:
+                proxy_url = None
+            now = time.monotonic()
+            ready_at = max(now, self._proxy_next_allowed.get(proxy_url, 0.0))
+            self._proxy_next_allowed[proxy_url] = ready_at + delay
+
+            if proxy_url is None:
+                session = self._session
+            else:
+                session = self._proxy_sessions.get(proxy_url)
+                if session is None:
+                    session = self._create_session(proxy_url)
+                    self._proxy_sessions[proxy_url] = session
+
+        wait = ready_at - now
+        # 低于下限的等待直接跳过
+        if wait >= _MIN_SLEEP:
+            self.logger.debug("延迟 %.2f 秒", wait)
+            time.sleep(wait)
+        return session, proxy_url
+
+    @property
+    def lib(self):
+        """共享客户端中已登录的 AsyncZlib 实例（未登录时为None）"""
+        return self.client.lib
+
+    def ensure_connected(self) -> bool:
+        """确保共享客户端已登录"""
+        return self.client.ensure_connected()
+
+    def invalidate_connection(self):
+        """标记连接失效，下次 ensure_connected 时重新登录"""
+        self.client.invalidate_connection()
+
+    def _run_async(self, coro):
+        """在共享客户端的事件循环中执行协程"""
+        return self.client.run(coro)
 
     def download_book(self, book_info: Dict[str, Any],
                       output_dir: str) -> Optional[str]:
@@ -611,6 +1152,22 @@ class ZLibraryDownloadService:
         Returns:
             Optional[str]: 下载的文件路径
         """
+        result = self.download_book_with_size(book_info, output_dir)
+        return result[0] if result else None
+
+    def download_book_with_size(
+            self, book_info: Dict[str, Any],
+            output_dir: str) -> Optional[Tuple[str, int]]:
+        """
+        下载书籍文件，同时返回写入的字节数，调用方无需再读取文件大小
+        
+        Args:
+            book_info: 书籍信息
+            output_dir: 输出目录
+            
+        Returns:
+            Optional[Tuple[str, int]]: (下载的文件路径, 文件大小)
+        """
         self.ensure_connected()
 
         output_path = Path(output_dir)
@@ -654,8 +1211,9 @@ class ZLibraryDownloadService:
             try:
                 self.logger.info(f"下载尝试 {title} {attempt}/{self.max_retries}")
 
-                # 智能延迟
-                self._smart_delay(request_type="download")
+                # 按代理限速后选择会话（会话已绑定代理）
+                session, proxy_url = self._acquire_session(
+                    request_type="download")
                 self.request_count += 1
 
                 # 获取下载链接（优先使用book_info中的，否则使用zlibrary API获取）
@@ -665,36 +1223,29 @@ class ZLibraryDownloadService:
                     # 这里可以添加通过zlibrary API获取下载链接的逻辑
                     raise ProcessingError(f"{title} 书籍信息中缺少下载链接")
 
-                # 使用requests下载文件
+                # User-Agent 已在会话中设置，这里只补充本次请求的头
                 headers = {
-                    'User-Agent':
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
                     # 'Referer':
                     # 'https://z-library.sk/',
                     # 'Accept':
                     # 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
                 }
 
-                self.logger.info(f"使用链接下载: {download_url}")
+                self.logger.info("使用链接下载: %s", download_url)
 
                 # Use cookies from book_info if provided (from discord bot)
-                # Otherwise use self.lib.cookies
-                cookies_to_use = book_info.get('cookies', self.lib.cookies if self.lib else {})
+                # Otherwise use the shared client's cookies
+                cookies_to_use = book_info.get('cookies', self.client.cookies)
                 
                 if cookies_to_use:
-                    headers['Cookie'] = "; ".join(
-                        [f"{k}={v}" for k, v in cookies_to_use.items()] +
-                        ["switchLanguage=zh", "siteLanguage=zh"])
-                    self.logger.info(f"Using {len(cookies_to_use)} cookies for authenticated download")
+                    headers['Cookie'] = self._cookie_header(cookies_to_use)
+                    self.logger.info("Using %d cookies for authenticated download",
+                                     len(cookies_to_use))
                 else:
                     self.logger.warning("No cookies available, download may fail")
 
-                # 配置代理
-                proxies = None
-                if self.proxy_list:
-                    proxy_url = random.choice(self.proxy_list)
-                    proxies = {'http': proxy_url, 'https': proxy_url}
-                    self.logger.info(f"使用代理: {proxy_url}")
+                if proxy_url:
+                    self.logger.info("使用代理: %s", proxy_url)
 
                 # 使用 AsyncZlib 的 cookies
                 # cookies = None
@@ -716,22 +1267,28 @@ class ZLibraryDownloadService:
                 #             f"获取 AsyncZlib cookies 失败: {str(e)}")
                 #         cookies = None
 
-                response = requests.get(
+                # 显式传入会话绑定的代理，避免被环境变量中的代理覆盖
+                response = session.get(
                     download_url,
                     headers=headers,
                     # cookies=cookies,
-                    proxies=proxies,
+                    proxies=session.proxies,
                     stream=True,
                     timeout=30)
 
-                # 检查响应状态
+                # 检查响应状态，404/410 表示文件不存在，重试无意义；
+                # 其他状态码交给下面的重试循环处理
                 if response.status_code != 200:
-                    raise ProcessingError(
-                        f"下载失败，HTTP状态码: {response.status_code}")
+                    status_code = response.status_code
+                    response.close()
+                    if status_code in (404, 410):
+                        raise ResourceNotFoundError(
+                            f"书籍文件不存在，HTTP状态码: {status_code}")
+                    raise ProcessingError(f"下载失败，HTTP状态码: {status_code}")
 
                 # 检查内容类型
                 content_type = response.headers.get('content-type', '')
-                self.logger.info(f"响应内容类型: {content_type}")
+                self.logger.info("响应内容类型: %s", content_type)
 
                 # 检查文件大小
                 content_length = response.headers.get('content-length')
@@ -754,7 +1311,6 @@ class ZLibraryDownloadService:
                 file_path = output_path / file_name
 
                 # 保存文件 - với progress bar
-                downloaded_size = 0
                 total_size = int(response.headers.get('content-length', 0))
                 
                 # Print initial progress
@@ -762,19 +1318,13 @@ class ZLibraryDownloadService:
                     print(f"\n📥 Downloading: {file_name}")
                     print(f"📦 Total size: {total_size / (1024*1024):.2f} MB")
                 
-                with open(str(file_path), 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded_size += len(chunk)
-                            
-                            # Print progress every 1MB
-                            if total_size > 0 and downloaded_size % (1024 * 1024) < 8192:
-                                percent = (downloaded_size / total_size) * 100
-                                downloaded_mb = downloaded_size / (1024 * 1024)
-                                total_mb = total_size / (1024 * 1024)
-                                # Print with carriage return to overwrite previous line
-                                print(f"\r⬇️  Progress: {percent:.1f}% ({downloaded_mb:.1f}/{total_mb:.1f} MB)", end='', flush=True)
+                # 大文件且服务器支持 Range 时并发分段下载，否则单连接流式下载
+                if self._can_download_ranged(response, total_size):
+                    downloaded_size = self._download_ranged(
+                        session, response, headers, file_path, total_size)
+                else:
+                    downloaded_size = self._write_stream(
+                        response, file_path, total_size)
                 
                 # Final newline after progress
                 if total_size > 0:
@@ -784,7 +1334,13 @@ class ZLibraryDownloadService:
 
                 self.consecutive_errors = 0
                 self.logger.info(f"下载成功: {file_path}")
-                return str(file_path)
+                return str(file_path), downloaded_size
+
+            except ResourceNotFoundError as e:
+                # 文件已不存在，重试无意义
+                self.consecutive_errors += 1
+                self.logger.error(f"下载尝试 {attempt} 失败: {str(e)}")
+                raise
 
             except Exception as e:
                 # traceback.print_exc()
@@ -828,78 +1384,185 @@ class ZLibraryDownloadService:
 
     # 已删除 _save_download_result，直接使用requests下载
 
+    def _write_stream(self, response: requests.Response, file_path: Path,
+                      total_size: int) -> int:
+        """
+        将流式响应体写入文件
+
+        Args:
+            response: stream=True 的响应
+            file_path: 目标文件路径
+            total_size: 预期大小（用于显示进度，未知时为0）
+
+        Returns:
+            int: 写入的字节数
+        """
+        # 由 shutil.copyfileobj 以大块在 C 层完成复制，
+        # 进度由包装后的文件对象在写入时统计；每个下载同一时刻只持有一个块，
+        # 峰值内存与文件大小无关
+        # urllib3 的 readinto 内部仍是 read 后再复制，复用缓冲区反而多一次复制
+        # 块大小已足够大，关闭 Python 层缓冲，避免数据再复制一次
+        response.raw.decode_content = True
+        with open(str(file_path), 'wb', buffering=0) as f:
+            _preallocate(f.fileno(), total_size)
+            writer = _ProgressWriter(f, total_size)
+            shutil.copyfileobj(response.raw, writer, _DOWNLOAD_CHUNK_SIZE)
+            # 实际数据少于预分配大小时去掉末尾的空白
+            if writer.written < total_size:
+                f.truncate(writer.written)
+            return writer.written
+
+    @staticmethod
+    def _can_download_ranged(response: requests.Response,
+                             total_size: int) -> bool:
+        """判断是否可以对该响应的资源进行分段下载"""
+        return (total_size >= _RANGED_MIN_SIZE
+                and response.headers.get('accept-ranges', '').lower() == 'bytes'
+                and not response.headers.get('content-encoding'))
+
+    def _download_ranged(self, session: requests.Session,
+                         response: requests.Response, headers: Dict[str, str],
+                         file_path: Path, total_size: int) -> int:
+        """
+        使用多个 Range 请求并发下载到预分配的文件，失败时回退到单连接下载
+
+        分段请求发往重定向后的最终地址，不会再次请求原始下载链接。
+
+        Args:
+            session: 下载使用的会话
+            response: 已获取响应头的初始响应（将被关闭）
+            headers: 请求头（包含 Cookie）
+            file_path: 目标文件路径
+            total_size: 文件总大小
+
+        Returns:
+            int: 写入的字节数
+
+        Raises:
+            ProcessingError: 单连接下载也失败，此时不完整的文件已被删除
+        """
+        url = response.url
+        response.close()
+
+        try:
+            return self._fetch_ranges(session, url, headers, file_path,
+                                      total_size)
+        except (ProcessingError, requests.RequestException, OSError) as e:
+            self.logger.warning("分段下载失败，改为单连接下载: %s", e)
+
+        try:
+            with session.get(url,
+                             headers=headers,
+                             proxies=session.proxies,
+                             stream=True,
+                             timeout=30) as retry_response:
+                if retry_response.status_code != 200:
+                    raise ProcessingError(
+                        f"下载失败，HTTP状态码: {retry_response.status_code}")
+                return self._write_stream(retry_response, file_path,
+                                          total_size)
+        except Exception:
+            # 删除预分配的不完整文件，避免被当作已下载的文件
+            file_path.unlink(missing_ok=True)
+            raise
+
+    def _fetch_ranges(self, session: requests.Session, url: str,
+                      headers: Dict[str, str], file_path: Path,
+                      total_size: int) -> int:
+        """并发获取各个分段并用 os.pwrite 写入文件对应位置"""
+        part_size = -(-total_size // _RANGED_PARTS)
+        ranges = [(start, min(start + part_size, total_size) - 1)
+                  for start in range(0, total_size, part_size)]
+
+        fd = os.open(str(file_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o644)
+        try:
+            _preallocate(fd, total_size)
+
+            def fetch(byte_range: Tuple[int, int]) -> int:
+                start, end = byte_range
+                range_headers = dict(headers)
+                range_headers['Range'] = f'bytes={start}-{end}'
+                with session.get(url,
+                                 headers=range_headers,
+                                 proxies=session.proxies,
+                                 stream=True,
+                                 timeout=30) as part:
+                    # 服务器忽略 Range 返回 200 时视为不支持分段
+                    if part.status_code != 206:
+                        raise ProcessingError(
+                            f"分段请求未返回206，HTTP状态码: {part.status_code}")
+                    offset = start
+                    for chunk in part.iter_content(_RANGED_READ_SIZE):
+                        view = memoryview(chunk)
+                        while view:
+                            written = os.pwrite(fd, view, offset)
+                            offset += written
+                            view = view[written:]
+                if offset != end + 1:
+                    raise ProcessingError(
+                        f"分段数据不完整: bytes={start}-{end}，实际到 {offset - 1}")
+                return offset - start
+
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                return sum(executor.map(fetch, ranges))
+        finally:
+            os.close(fd)
+
     def _extract_filename_from_content_disposition(
             self, content_disposition: str) -> Optional[str]:
         """从 Content-Disposition 头中提取文件名"""
         if not content_disposition:
             return None
-
-        # 匹配 filename="xxx" 或 filename*=UTF-8''xxx 格式
-        import re
-
-        # 首先尝试匹配 filename*=UTF-8''xxx 格式（RFC 5987）
-        match = re.search(r"filename\*=UTF-8''([^;]+)", content_disposition,
-                          re.IGNORECASE)
-        if match:
-            import urllib.parse
-            try:
-                filename = urllib.parse.unquote(match.group(1))
-                return filename
-            except:
-                pass
-
-        # 然后尝试匹配 filename="xxx" 或 filename=xxx 格式
-        match = re.search(r'filename[^;=\n]*=(([\'"])([^\'"]*?)\2|([^;\n]*))',
-                          content_disposition, re.IGNORECASE)
-        if match:
-            filename = match.group(3) or match.group(4)
-            if filename:
-                return filename.strip()
-
-        return None
+        return _parse_content_disposition_filename(content_disposition)
 
     def _sanitize_filename(self, filename: str) -> str:
         """清理文件名"""
-        illegal_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
-        for char in illegal_chars:
-            filename = filename.replace(char, '_')
+        filename = filename.encode('utf-8', 'surrogatepass').translate(
+            _ILLEGAL_FILENAME_TABLE).decode('utf-8', 'surrogatepass')
 
         # 限制长度
         if len(filename) > 200:
-            name_parts = filename.split('.')
-            extension = name_parts[-1] if len(name_parts) > 1 else ''
-            base_name = '.'.join(
-                name_parts[:-1]) if len(name_parts) > 1 else filename
-            base_name = base_name[:200 - len(extension) - 1]
-            filename = f"{base_name}.{extension}" if extension else base_name
+            base_name, extension = os.path.splitext(filename)
+            # 过长的“扩展名”多半是书名中的点号，按无扩展名处理
+            if len(extension) >= 200:
+                base_name, extension = filename, ''
+            filename = base_name[:200 - len(extension)] + extension
 
         return filename
 
-    def _smart_delay(self,
-                     base_min: float = None,
-                     base_max: float = None,
-                     request_type: str = "normal"):
-        """智能延迟"""
+    def _compute_delay(self,
+                       base_min: float = None,
+                       base_max: float = None,
+                       request_type: str = "normal") -> float:
+        """计算本次请求的延迟时间（秒，精确到毫秒）"""
         min_delay = base_min or self.min_delay
         max_delay = base_max or self.max_delay
 
         # 根据请求类型调整延迟
         if request_type == "download":
-            min_delay = max(min_delay * 1.5, 3.0)
-            max_delay = max(max_delay * 1.5, 6.0)
+            min_delay = max(min_delay * 1.5, _DOWNLOAD_DELAY_MIN)
+            max_delay = max(max_delay * 1.5, _DOWNLOAD_DELAY_MAX)
         elif request_type == "error":
-            min_delay = max(min_delay * 2, 5.0)
-            max_delay = max(max_delay * 2, 10.0)
+            min_delay = max(min_delay * 2, _ERROR_DELAY_MIN)
+            max_delay = max(max_delay * 2, _ERROR_DELAY_MAX)
 
         # 根据连续错误增加延迟
         if self.consecutive_errors > 0:
-            error_multiplier = min(1.5**self.consecutive_errors, 4.0)
+            error_multiplier = _ERROR_MULTIPLIERS[min(
+                self.consecutive_errors, len(_ERROR_MULTIPLIERS) - 1)]
             min_delay *= error_multiplier
             max_delay *= error_multiplier
 
-        # 执行延迟
-        delay = random.uniform(min_delay, max_delay)
-        self.logger.debug(f"延迟 {delay:.2f} 秒")
+        return round(random.random() * (max_delay - min_delay) + min_delay, 3)
+
+    def _smart_delay(self,
+                     base_min: float = None,
+                     base_max: float = None,
+                     request_type: str = "normal"):
+        """智能延迟"""
+        delay = self._compute_delay(base_min, base_max, request_type)
+        self.logger.debug("延迟 %.2f 秒", delay)
         time.sleep(delay)
 
 
@@ -924,19 +1587,23 @@ class ZLibraryService:
         """
         self.logger = get_logger("zlibrary_service")
 
+        # 搜索和下载共用一个已登录的客户端，只需登录一次
+        self.client = ZLibraryClient(email=email,
+                                     password=password,
+                                     proxy_list=proxy_list)
+
         # 初始化子服务
-        self.search_service = ZLibrarySearchService(email=email,
-                                                    password=password,
-                                                    proxy_list=proxy_list)
+        self.search_service = ZLibrarySearchService(client=self.client)
 
         self.download_service = ZLibraryDownloadService(
-            email=email,
-            password=password,
-            proxy_list=proxy_list,
-            format_priority=format_priority)
+            client=self.client, format_priority=format_priority)
 
         self.download_dir = download_dir
 
+        # 下载限制缓存：(获取时间, 限制信息)，短时间内的重复检查复用结果
+        self._limits_cache: Optional[Tuple[float, Dict[str, int]]] = None
+        self._limits_ttl = 60.0
+
     def search_books(self,
                      title: str = None,
                      author: str = None,
@@ -972,48 +1639,177 @@ class ZLibraryService:
         Returns:
             Optional[str]: 下载的文件路径
         """
+        result = self.download_book_with_size(book_info, output_dir)
+        return result[0] if result else None
+
+    def download_book_with_size(
+            self,
+            book_info: Dict[str, Any],
+            output_dir: str = None) -> Optional[Tuple[str, int]]:
+        """
+        下载书籍文件，同时返回写入的字节数
+        
+        Args:
+            book_info: 书籍信息
+            output_dir: 输出目录
+            
+        Returns:
+            Optional[Tuple[str, int]]: (下载的文件路径, 文件大小)
+        """
         if output_dir is None:
             output_dir = self.download_dir
 
-        return self.download_service.download_book(book_info, output_dir)
-
-    def get_download_limits(self) -> Dict[str, int]:
+        result = self.download_service.download_book_with_size(
+            book_info, output_dir)
+        if result:
+            # 下载会消耗次数，缓存的限制信息已过时
+            self.reset_limits_cache()
+        return result
+
+    def close(self):
+        """释放事件循环和HTTP会话，服务关闭或被替换时调用"""
+        self.client.close()
+        self.download_service.close()
+
+    def reset_limits_cache(self):
+        """清除缓存的下载限制信息，下次获取时重新请求"""
+        self._limits_cache = None
+
+    def get_download_limits(self,
+                            force_refresh: bool = False,
+                            raise_on_error: bool = False) -> Dict[str, int]:
         """
         获取Z-Library下载限制信息
         
+        Args:
+            force_refresh: 是否忽略缓存，强制重新请求
+            raise_on_error: 获取失败时是否抛出异常，默认返回全零的默认值
+        
         Returns:
             Dict[str, int]: 包含下载限制信息的字典
                 - daily_amount: 每日总限额
                 - daily_allowed: 每日允许下载
                 - daily_remaining: 每日剩余下载次数 
                 - daily_reset: 下次重置时间戳
+
+        Raises:
+            Exception: raise_on_error 为 True 且登录或请求失败时
         """
+        cached = self._get_cached_limits(force_refresh)
+        if cached is not None:
+            return cached
+
         try:
-            # 确保下载服务连接
-            self.download_service.ensure_connected()
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            # 仍可正常获取（协程在客户端自己的事件循环中执行），但会阻塞调用方的循环
+            self.logger.warning(
+                "在运行中的事件循环内同步获取下载限制，请改用 get_download_limits_async")
+
+        try:
+            return self._fetch_limits()
+        except Exception as e:
+            self.logger.error(f"获取下载限制失败: {str(e)}")
+            if raise_on_error:
+                raise
+            # 返回默认值，避免阻塞流程
+            return self._default_limits()
+
+    def _fetch_limits(self) -> Dict[str, int]:
+        """
+        登录（如有必要）并请求下载限制，成功后写入缓存
+
+        Returns:
+            Dict[str, int]: 下载限制信息
+
+        Raises:
+            NetworkError: 登录失败
+            TimeoutError: 请求超时
+        """
+        # 确保下载服务连接
+        self.download_service.ensure_connected()
+
+        # 获取限制信息，超时后取消请求，避免无限期阻塞调用方
+        limits = self.client.run(
+            self.download_service.lib.profile.get_limits(),
+            timeout=_LIMITS_TIMEOUT)
 
-            # 获取限制信息
-            limits = asyncio.run(
-                self.download_service.lib.profile.get_limits())
+        self.logger.info(f"获取下载限制: {limits}")
+
+        self._limits_cache = (time.monotonic(), limits)
+        return limits
+
+    async def get_download_limits_async(
+            self, force_refresh: bool = False) -> Dict[str, int]:
+        """
+        异步获取Z-Library下载限制信息，等待期间不阻塞调用方的事件循环
+        
+        Args:
+            force_refresh: 是否忽略缓存，强制重新请求
+        
+        Returns:
+            Dict[str, int]: 与 get_download_limits 相同的下载限制信息
+        """
+        cached = self._get_cached_limits(force_refresh)
+        if cached is not None:
+            return cached
+
+        try:
+            # 登录是同步的，放到线程中执行
+            await asyncio.to_thread(self.download_service.ensure_connected)
+
+            limits = await asyncio.wait_for(
+                self.client.run_async(
+                    self.download_service.lib.profile.get_limits()),
+                _LIMITS_TIMEOUT)
 
             self.logger.info(f"获取下载限制: {limits}")
 
+            self._limits_cache = (time.monotonic(), limits)
             return limits
 
         except Exception as e:
             self.logger.error(f"获取下载限制失败: {str(e)}")
             # 返回默认值，避免阻塞流程
-            return {
-                'daily_amount': 0,
-                'daily_allowed': 0,
-                'daily_remaining': 0,
-                'daily_reset': 0
-            }
+            return self._default_limits()
+
+    def get_cached_download_limits(self) -> Optional[Dict[str, int]]:
+        """返回未过期的缓存下载限制，不发起请求；没有可用缓存时返回None"""
+        return self._get_cached_limits(False)
+
+    def _get_cached_limits(self,
+                           force_refresh: bool) -> Optional[Dict[str, int]]:
+        """返回未过期的缓存下载限制，无缓存、已过期或强制刷新时返回None"""
+        cached = self._limits_cache
+        if (not force_refresh and cached is not None
+                and time.monotonic() - cached[0] < self._limits_ttl):
+            return cached[1]
+        return None
 
-    async def get_download_quota(self) -> Dict[str, Any]:
+    @staticmethod
+    def _default_limits() -> Dict[str, int]:
+        """获取失败时使用的默认下载限制"""
+        return {
+            'daily_amount': 0,
+            'daily_allowed': 0,
+            'daily_remaining': 0,
+            'daily_reset': 0
+        }
+
+    def invalidate_connection(self):
+        """使共享客户端的连接失效，下次调用时重新登录"""
+        self.client.invalidate_connection()
+
+    async def get_download_quota(self,
+                                 force_refresh: bool = False) -> Dict[str, Any]:
         """
         异步获取下载配额信息（供QuotaManager使用）
         
+        Args:
+            force_refresh: 是否忽略下载限制缓存，强制重新请求
+        
         Returns:
             Dict[str, Any]: 配额信息字典
                 - remaining: 剩余下载次数
@@ -1021,7 +1817,7 @@ class ZLibraryService:
                 - next_reset: 下次重置时间
         """
         try:
-            limits = self.get_download_limits()
+            limits = await self.get_download_limits_async(force_refresh)
             return {
                 'remaining': limits.get('daily_remaining', 0),
                 'daily_limit': limits.get('daily_amount', 10),
@@ -1029,7 +1825,6 @@ class ZLibraryService:
             }
         except Exception as e:
             self.logger.error(f"获取配额信息失败: {e}")
-            from core.pipeline import NetworkError
             raise NetworkError(f"无法获取配额信息: {e}")
 
     def check_download_available(self) -> bool:
@@ -1040,21 +1835,17 @@ class ZLibraryService:
             bool: 是否可以下载
         """
         try:
-            # 确保下载服务已连接
-            if not self.download_service.ensure_connected():
-                self.logger.error("无法连接到Z-Library下载服务")
-                return False
-
-            limits = self.get_download_limits()
+            # 缓存有效时不发起请求；否则一次登录检查加一次限制查询
+            limits = self._get_cached_limits(False) or self._fetch_limits()
             remaining = limits.get('daily_remaining', 0)
 
-            self.logger.info(f"下载限制检查: 剩余次数 {remaining}")
+            self.logger.info("下载限制检查: 剩余次数 %s", remaining)
 
             return remaining > 0
         except Exception as e:
             self.logger.error(f"检查下载可用性失败: {str(e)}")
-            # 出现异常时假设可以下载，避免阻塞流程
-            return True
+            # 无法确认剩余次数时视为不可下载，与 QuotaManager 的处理一致
+            return False
 
     # 已删除 search_and_download 方法，完全分离 search 和 download 步骤
 
@@ -1072,3 +1863,18 @@ class ZLibraryService:
         """
         return self.search_service.calculate_match_score(
             douban_book, zlibrary_book)
+
+    def rank_candidates(self, douban_book: Dict[str, str],
+                        zlibrary_books: List[Dict[str, Any]]) -> List[float]:
+        """
+        批量计算豆瓣书籍与多个Z-Library候选的匹配度得分
+        
+        Args:
+            douban_book: 豆瓣书籍信息字典
+            zlibrary_books: Z-Library书籍信息字典列表
+            
+        Returns:
+            List[float]: 与 zlibrary_books 顺序一致的匹配度得分
+        """
+        return self.search_service.rank_candidates(douban_book,
+                                                   zlibrary_books)
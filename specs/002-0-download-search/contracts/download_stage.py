@@ -72,6 +72,12 @@ class EnhancedDownloadStageContract(ABC):
             - 查询状态为SEARCH_COMPLETE_QUOTA_EXHAUSTED的书籍
             - 检查当前配额状态
             - 将符合条件的书籍状态更新为DOWNLOAD_QUEUED
+            
+        Performance:
+            - 用一条查询取出最多"当前剩余配额"本书籍（LIMIT），不逐本查询
+            - 用一条批量UPDATE（WHERE id IN (...)）更新状态，不逐本更新
+            - 如需逐本准备工作，使用 asyncio.gather 并发执行
+            - 数据库往返次数不随书籍数量增长（不超过2次）
         """
         pass
 
@@ -153,6 +159,20 @@ CONTRACT_TEST_SCENARIOS = [
             "final_status": "DOWNLOAD_QUEUED"
         }
     },
+    {
+        "name": "resume_quota_exhausted_books_parallel",
+        "description": "批量恢复书籍时数据库往返次数与书籍数量无关",
+        "setup": {
+            "quota_exhausted_count": 50,
+            "current_quota": 20
+        },
+        "expected": {
+            "return_value": 20,
+            "books_status_updated": 20,
+            "final_status": "DOWNLOAD_QUEUED",
+            "max_db_round_trips": 2
+        }
+    },
     {
         "name": "resume_quota_exhausted_books_still_no_quota",
         "description": "配额仍不足时不恢复书籍",
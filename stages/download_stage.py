@@ -5,9 +5,17 @@
 负责从Z-Library下载书籍文件。
 """
 
+import asyncio
+import logging
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
 
 from core.pipeline import (BaseStage, DownloadLimitExhaustedError,
                            NetworkError, ProcessingError,
@@ -19,6 +27,54 @@ from db.models import (BookStatus, DoubanBook, DownloadQueue, DownloadRecord,
 from services.zlibrary_service import ZLibraryService
 from services.lark_service import LarkService
 
+# 可以被领取下载的队列项状态（downloading 用于中断后继续）
+_CLAIMABLE_QUEUE_STATUSES = ('queued', 'downloading')
+
+# 下载阶段可以处理的书籍状态
+_PROCESSABLE_BOOK_STATUSES = frozenset((
+    BookStatus.SEARCH_COMPLETE,
+    BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED,
+    BookStatus.DOWNLOAD_QUEUED,
+    BookStatus.DOWNLOAD_ACTIVE,
+))
+
+# 下载失败时用于判断错误类型的关键字，一次扫描找出全部命中项
+_ERROR_KEYWORD_RE = re.compile(r'timeout|connection|not found|404', re.IGNORECASE)
+_NETWORK_ERROR_KEYWORDS = frozenset(('timeout', 'connection'))
+
+# 下载可用性检查结果的缓存时间（秒）
+_LIMIT_CACHE_TTL = 30.0
+
+# 每本书都会执行的查询只构造一次，执行时传入 book_id，
+# 省去逐次构造语句的开销，编译结果由引擎的语句缓存复用
+_QUEUE_ITEM_STMT = select(DownloadQueue).where(
+    DownloadQueue.douban_book_id == bindparam('book_id')).limit(1)
+
+# 最近一次成功下载的文件路径
+_EXISTING_PATH_SUBQUERY = select(DownloadRecord.file_path).where(
+    DownloadRecord.book_id == bindparam('book_id'),
+    DownloadRecord.status == "success",
+    DownloadRecord.file_path.isnot(None)
+).order_by(DownloadRecord.id.desc()).limit(1).scalar_subquery()
+
+# 以书籍为锚点，一次取回已有下载路径、队列项和关联的ZLibraryBook
+_CLAIM_LOOKUP_STMT = select(
+    DoubanBook.status.label('book_status'),
+    _EXISTING_PATH_SUBQUERY.label('existing_path'),
+    DownloadQueue.id.label('queue_id'),
+    DownloadQueue.status, DownloadQueue.download_url,
+    DownloadQueue.priority, ZLibraryBook.zlibrary_id,
+    ZLibraryBook.title, ZLibraryBook.authors,
+    ZLibraryBook.extension, ZLibraryBook.size,
+    ZLibraryBook.url).select_from(DoubanBook).outerjoin(
+        DownloadQueue, DownloadQueue.douban_book_id == DoubanBook.id
+    ).outerjoin(
+        ZLibraryBook, ZLibraryBook.id == DownloadQueue.zlibrary_book_id
+    ).where(DoubanBook.id == bindparam('book_id'))
+
+# 异步下载线程池的最大并发下载数，与 PipelineManager 默认工作线程数一致
+_MAX_PARALLEL_DOWNLOADS = 4
+
 
 class DownloadStage(BaseStage):
     """下载处理阶段"""
@@ -47,8 +103,20 @@ class DownloadStage(BaseStage):
         self.download_dir = Path(download_dir)
         self.lark_service = lark_service
 
-        # 确保下载目录存在
-        os.makedirs(self.download_dir, exist_ok=True)
+        # 下载可用性缓存：(过期时间, 是否可用, 剩余次数)，剩余次数未知时为None
+        self._limit_cache: Optional[Tuple[float, bool, Optional[int]]] = None
+        self._limit_lock = threading.Lock()
+
+        # 状态回退同一时间只由一个工作线程执行
+        self._rollback_lock = threading.Lock()
+
+        # 异步下载使用专用的有界线程池，避免并发下载占满事件循环的默认线程池
+        self._download_executor = ThreadPoolExecutor(
+            max_workers=_MAX_PARALLEL_DOWNLOADS, thread_name_prefix="download")
+
+        # 下载时传给服务的目录字符串只转换一次；目录本身由下载服务在每次
+        # 写入文件前创建，运行期间被删除也能恢复
+        self._download_dir_str = str(self.download_dir)
     
     def can_process(self, book: DoubanBook) -> bool:
         """
@@ -68,25 +136,20 @@ class DownloadStage(BaseStage):
                 return False
             
             current_status = fresh_book.status
-            self.logger.info(f"检查书籍处理能力: {book.title}, 数据库状态: {current_status.value}, 传入状态: {book.status.value}")
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("检查书籍处理能力: %s, 数据库状态: %s, 传入状态: %s",
+                                 book.title, current_status.value, book.status.value)
             
             # 检查书籍状态是否符合处理条件
             # 接受SEARCH_COMPLETE、SEARCH_COMPLETE_QUOTA_EXHAUSTED、DOWNLOAD_QUEUED和DOWNLOAD_ACTIVE状态的书籍
-            acceptable_statuses = [
-                BookStatus.SEARCH_COMPLETE,
-                BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED,
-                BookStatus.DOWNLOAD_QUEUED,
-                BookStatus.DOWNLOAD_ACTIVE
-            ]
-            if current_status not in acceptable_statuses:
+            if current_status not in _PROCESSABLE_BOOK_STATUSES:
                 self.logger.warning(f"无法处理书籍: {book.title}, 状态: {current_status.value}")
                 return False
                 
             # 检查下载队列中是否有该书籍的待处理项
             # 对于SEARCH_COMPLETE状态的书籍，如果队列项是failed状态，需要重置为queued以便重试
-            queue_item = session.query(DownloadQueue).filter(
-                DownloadQueue.douban_book_id == book.id
-            ).first()
+            queue_item = session.execute(
+                _QUEUE_ITEM_STMT, {'book_id': book.id}).scalars().first()
 
             if not queue_item:
                 self.logger.warning(f"下载队列中未找到书籍: {book.title}")
@@ -94,7 +157,7 @@ class DownloadStage(BaseStage):
 
             # 如果是SEARCH_COMPLETE状态的书籍，且队列项是failed状态，重置为queued状态以便重试
             if current_status == BookStatus.SEARCH_COMPLETE and queue_item.status == 'failed':
-                self.logger.info(f"重置失败的下载队列项为待处理: {book.title}")
+                self.logger.info("重置失败的下载队列项为待处理: %s", book.title)
                 queue_item.status = 'queued'
                 queue_item.error_message = None  # 清除之前的错误信息
                 session.add(queue_item)
@@ -102,14 +165,14 @@ class DownloadStage(BaseStage):
 
             # 检查队列项状态是否允许处理
             if queue_item.status not in ['queued', 'downloading']:
-                self.logger.info(f"下载队列项状态不允许处理: {book.title}, 队列状态: {queue_item.status}")
+                self.logger.info("下载队列项状态不允许处理: %s, 队列状态: %s", book.title, queue_item.status)
                 return False
 
-            self.logger.info(f"下载队列检查通过: {book.title}, 队列状态: {queue_item.status}")
+            self.logger.info("下载队列检查通过: %s, 队列状态: %s", book.title, queue_item.status)
 
             # 检查Z-Library下载限制
-            available = self.zlibrary_service.check_download_available()
-            self.logger.info(f"Z-Library下载可用性检查: {book.title}, 结果: {available}")
+            available = self._is_download_available()
+            self.logger.info("Z-Library下载可用性检查: %s, 结果: %s", book.title, available)
 
             if not available:
                 limits = self.zlibrary_service.get_download_limits()
@@ -119,8 +182,7 @@ class DownloadStage(BaseStage):
 
                 # 只有当剩余次数确实为0时才回退状态
                 if remaining <= 0:
-                    rollback_count = self.state_manager.rollback_download_tasks_when_limit_exhausted(reset_time)
-                    self.logger.info(f"下载次数不足，已回退 {rollback_count} 本书籍状态到搜索完成")
+                    self._rollback_when_limit_exhausted(reset_time)
                 else:
                     self.logger.warning(f"下载检查返回不可用但剩余次数为{remaining}，可能是检查逻辑问题")
 
@@ -129,6 +191,29 @@ class DownloadStage(BaseStage):
             
             return True
     
+    def _rollback_when_limit_exhausted(self, reset_time: str) -> int:
+        """
+        下载次数耗尽时回退下载任务状态
+        
+        每次都会执行回退，没有需要回退的书籍时只有一次查询；
+        其他工作线程正在回退时直接跳过，避免争用相同的行锁。
+        
+        Args:
+            reset_time: 下载次数重置时间
+            
+        Returns:
+            int: 回退的书籍数量，其他线程正在回退时为0
+        """
+        if not self._rollback_lock.acquire(blocking=False):
+            self.logger.debug("其他线程正在回退下载任务状态，跳过")
+            return 0
+        try:
+            rollback_count = self.state_manager.rollback_download_tasks_when_limit_exhausted(reset_time)
+        finally:
+            self._rollback_lock.release()
+        self.logger.info(f"下载次数不足，已回退 {rollback_count} 本书籍状态到搜索完成")
+        return rollback_count
+
     def process(self, book: DoubanBook) -> bool:
         """
         处理书籍 - 下载文件
@@ -139,14 +224,16 @@ class DownloadStage(BaseStage):
         Returns:
             bool: 处理是否成功
         """
-        # 注意：can_process检查已经在pipeline层面完成，这里不需要重复检查
-        # 如果到达这里，说明书籍已经通过了can_process验证
+        # 注意：can_process检查已经在pipeline层面完成，这里不需要重复调用；
+        # 书籍状态和队列项会在领取队列项的同一查询中再次校验
         
         try:
-            self.logger.info(f"下载书籍: {book.title}")
+            self.logger.info("下载书籍: %s", book.title)
             
-            # 再次检查下载限制（可能在can_process和process之间状态发生变化）
-            available = self.zlibrary_service.check_download_available()
+            # 再次检查下载限制（可能在can_process和process之间状态发生变化）；
+            # 结果在 _LIMIT_CACHE_TTL 内直接取自缓存，不会重复请求服务端，
+            # 缓存期间用完次数时由下载请求本身的429错误兜底
+            available = self._is_download_available()
             if not available:
                 limits = self.zlibrary_service.get_download_limits()
                 remaining = limits.get('daily_remaining', 0)
@@ -155,8 +242,7 @@ class DownloadStage(BaseStage):
 
                 # 只有当剩余次数确实为0时才回退状态和抛出异常
                 if remaining <= 0:
-                    rollback_count = self.state_manager.rollback_download_tasks_when_limit_exhausted(reset_time)
-                    self.logger.info(f"下载次数不足，已回退 {rollback_count} 本书籍状态到搜索完成")
+                    self._rollback_when_limit_exhausted(reset_time)
 
                     # 抛出非重试性异常，让任务调度器正确处理
                     raise DownloadLimitExhaustedError(
@@ -167,29 +253,19 @@ class DownloadStage(BaseStage):
                     self.logger.warning(f"下载检查返回不可用但剩余次数为{remaining}，继续尝试下载")
                     # 继续执行下载流程
             
-            # 检查是否已有成功的下载记录
-            with self.state_manager.get_session() as session:
-                existing_download = session.query(DownloadRecord).filter(
-                    DownloadRecord.book_id == book.id,
-                    DownloadRecord.status == "success"
-                ).first()
+            # 检查是否已有成功的下载记录，没有时从下载队列领取任务
+            existing_path, queue_item_data = self._claim_queue_item(book)
             
-            if existing_download and existing_download.file_path and os.path.exists(existing_download.file_path):
-                self.logger.info(f"书籍已下载: {book.title}, 路径: {existing_download.file_path}")
+            if existing_path:
+                self.logger.info("书籍已下载: %s, 路径: %s", book.title, existing_path)
                 return True
             
-            # 从下载队列获取任务
-            queue_item_data = self._get_queue_item(book)
-            
             if not queue_item_data:
                 self.logger.error(f"未找到下载队列项: {book.title}")
                 raise ResourceNotFoundError(f"未找到下载队列项: {book.title}")
             
-            # 将队列项标记为正在下载
-            self._update_queue_status(queue_item_data['queue_id'], 'downloading')
-            
             # 执行下载
-            file_path = self._download_book(book, queue_item_data)
+            file_path, file_size = self._download_book(book, queue_item_data)
             
             if not file_path:
                 raise ProcessingError(f"下载失败: {book.title}")
@@ -200,54 +276,115 @@ class DownloadStage(BaseStage):
                     book_id=book.id,
                     zlibrary_id=queue_item_data['zlibrary_id'],
                     file_format=queue_item_data['extension'],
-                    file_size=self._get_file_size(file_path),
+                    file_size=file_size,
                     file_path=file_path,
                     download_url=queue_item_data.get('download_url', ''),
                     status="success"
                 )
                 
                 session.add(download_record)
+                
+                # 在同一事务中标记队列项为完成
+                session.execute(
+                    update(DownloadQueue).where(
+                        DownloadQueue.id == queue_item_data['queue_id']
+                    ).values(status='completed'))
                 # session的commit在get_session上下文管理器中自动处理
             
-            # 标记队列项为完成
-            self._update_queue_status(queue_item_data['queue_id'], 'completed')
+            # 本地扣减剩余次数，大多数书籍无需重新查询下载限制
+            self._consume_download_slot()
             
-            self.logger.info(f"成功下载书籍: {book.title}, 路径: {file_path}")
+            self.logger.info("成功下载书籍: %s, 路径: %s", book.title, file_path)
             return True
             
         except ResourceNotFoundError:
             # 资源未找到，不需要重试
             raise
+        except DownloadLimitExhaustedError:
+            # 下载次数耗尽，缓存的可用性已不可信；保留异常类型交给调度器处理
+            self.invalidate_limit_cache()
+            raise
         except Exception as e:
-            self.logger.error(f"下载书籍失败: {str(e)}")
+            error_msg = str(e)
+            self.logger.error(f"下载书籍失败: {error_msg}")
+            
+            # 被限流时缓存的可用性已不可信
+            if "429" in error_msg:
+                self.invalidate_limit_cache()
             
             # 特殊处理：如果是状态不匹配错误（can_process返回False导致的），直接跳过
-            if "状态不匹配" in str(e):
+            if "状态不匹配" in error_msg:
                 self.logger.warning(f"书籍状态不符合下载阶段处理条件，跳过: {book.title}")
-                raise ProcessingError(f"状态不匹配: {str(e)}", retryable=False)
+                if isinstance(e, ProcessingError) and not e.retryable:
+                    raise
+                raise ProcessingError(f"状态不匹配: {error_msg}", retryable=False)
             
             # 创建失败的下载记录并更新队列状态
             with self.state_manager.get_session() as session:
                 download_record = DownloadRecord(
                     book_id=book.id,
                     status="failed",
-                    error_message=str(e)
+                    error_message=error_msg
                 )
                 session.add(download_record)
+                
+                # 在同一事务中标记队列项为失败
+                session.execute(
+                    update(DownloadQueue).where(
+                        DownloadQueue.douban_book_id == book.id,
+                        DownloadQueue.status.in_(_CLAIMABLE_QUEUE_STATUSES)
+                    ).values(status='failed', error_message=error_msg))
                 # session的commit在get_session上下文管理器中自动处理
             
-            # 标记队列项为失败
-            queue_item_data = self._get_queue_item(book)
-            if queue_item_data:
-                self._update_queue_status(queue_item_data['queue_id'], 'failed', str(e))
-            
-            # 判断错误类型
-            if "timeout" in str(e).lower() or "connection" in str(e).lower():
-                raise NetworkError(f"网络错误: {str(e)}")
-            elif "not found" in str(e).lower() or "404" in str(e).lower():
-                raise ResourceNotFoundError(f"资源未找到: {str(e)}")
+            # 判断错误类型，网络错误优先于资源未找到
+            keywords = {
+                keyword.lower()
+                for keyword in _ERROR_KEYWORD_RE.findall(error_msg)
+            }
+            if keywords & _NETWORK_ERROR_KEYWORDS:
+                raise NetworkError(f"网络错误: {error_msg}")
+            elif keywords:
+                raise ResourceNotFoundError(f"资源未找到: {error_msg}")
+            else:
+                raise ProcessingError(f"下载失败: {error_msg}")
+    
+    def _is_download_available(self) -> bool:
+        """
+        检查Z-Library下载次数是否可用，结果缓存 _LIMIT_CACHE_TTL 秒
+        
+        Returns:
+            bool: 是否可以下载
+        """
+        with self._limit_lock:
+            cached = self._limit_cache
+            if cached is not None and time.monotonic() < cached[0]:
+                return cached[1]
+        
+        available = self.zlibrary_service.check_download_available()
+        # 检查成功时服务端已缓存限制信息，这里只读取缓存，不再发起请求
+        limits = self.zlibrary_service.get_cached_download_limits()
+        remaining = limits.get('daily_remaining') if limits else None
+        
+        with self._limit_lock:
+            self._limit_cache = (time.monotonic() + _LIMIT_CACHE_TTL, available, remaining)
+        return available
+    
+    def _consume_download_slot(self) -> None:
+        """下载成功后扣减缓存中的剩余次数，用完时让缓存失效以便重新查询"""
+        with self._limit_lock:
+            cached = self._limit_cache
+            if cached is None or cached[2] is None:
+                return
+            remaining = cached[2] - 1
+            if remaining <= 0:
+                self._limit_cache = None
             else:
-                raise ProcessingError(f"下载失败: {str(e)}")
+                self._limit_cache = (cached[0], cached[1], remaining)
+    
+    def invalidate_limit_cache(self) -> None:
+        """清除缓存的下载可用性，下次检查时重新查询"""
+        with self._limit_lock:
+            self._limit_cache = None
     
     def get_next_status(self, success: bool) -> BookStatus:
         """
@@ -264,67 +401,70 @@ class DownloadStage(BaseStage):
         else:
             return BookStatus.DOWNLOAD_FAILED
     
-    def _get_queue_item(self, book: DoubanBook) -> Optional[Dict[str, Any]]:
+    def _claim_queue_item(
+            self, book: DoubanBook
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
         """
-        获取下载队列项
+        检查已有下载记录并领取书籍的下载队列项
+        
+        一条查询以书籍为锚点同时取回最近一次成功下载的文件路径、队列项和
+        关联的ZLibraryBook；需要下载时再用一条 UPDATE 将队列项标记为正在下载，
+        两条语句共用一个事务。
         
         Args:
             book: 书籍对象
             
         Returns:
-            Optional[Dict[str, Any]]: 队列项数据字典
+            Tuple[Optional[str], Optional[Dict[str, Any]]]:
+                (已下载且文件仍存在的路径, 领取到的队列项数据)，
+                已下载时不领取队列项，两者都为None表示没有可领取的队列项
+                
+        Raises:
+            ProcessingError: 书籍当前状态不属于下载阶段（不可重试）
         """
         with self.state_manager.get_session() as session:
-            queue_item = session.query(DownloadQueue).filter(
-                DownloadQueue.douban_book_id == book.id,
-                DownloadQueue.status.in_(['queued', 'downloading'])
-            ).first()
-            
-            if not queue_item:
-                return None
-            
-            # 获取关联的ZLibraryBook数据
-            zlibrary_book = session.query(ZLibraryBook).filter(
-                ZLibraryBook.id == queue_item.zlibrary_book_id
-            ).first()
-            
-            if not zlibrary_book:
-                return None
-            
-            return {
-                'queue_id': queue_item.id,
-                'zlibrary_id': zlibrary_book.zlibrary_id,
-                'title': zlibrary_book.title,
-                'authors': zlibrary_book.authors,
-                'extension': zlibrary_book.extension,
-                'size': zlibrary_book.size,
-                'url': zlibrary_book.url,
-                'download_url': queue_item.download_url,
-                'priority': queue_item.priority,
-                'status': queue_item.status
+            row = session.execute(_CLAIM_LOOKUP_STMT, {
+                'book_id': book.id
+            }).first()
+            
+            if row is None:
+                return None, None
+            # 书籍状态与队列项在同一查询中校验，process 无需再调用 can_process
+            if row.book_status not in _PROCESSABLE_BOOK_STATUSES:
+                raise ProcessingError(
+                    f"状态不匹配: {book.title}, 状态: {row.book_status.value}",
+                    retryable=False)
+            if row.existing_path and os.path.exists(row.existing_path):
+                return row.existing_path, None
+            if (row.queue_id is None or row.zlibrary_id is None
+                    or row.status not in _CLAIMABLE_QUEUE_STATUSES):
+                return None, None
+            
+            # 带状态条件更新，并发领取时只有一方成功
+            claimed = session.execute(
+                update(DownloadQueue).where(
+                    DownloadQueue.id == row.queue_id,
+                    DownloadQueue.status.in_(_CLAIMABLE_QUEUE_STATUSES)
+                ).values(status='downloading')
+            ).rowcount
+            if not claimed:
+                return None, None
+            
+            return None, {
+                'queue_id': row.queue_id,
+                'zlibrary_id': row.zlibrary_id,
+                'title': row.title,
+                'authors': row.authors,
+                'extension': row.extension,
+                'size': row.size,
+                'url': row.url,
+                'download_url': row.download_url,
+                'priority': row.priority,
+                'status': 'downloading'
             }
     
-    def _update_queue_status(self, queue_id: int, status: str, error_message: str = None):
-        """
-        更新队列项状态
-        
-        Args:
-            queue_id: 队列项ID
-            status: 新状态
-            error_message: 错误信息（可选）
-        """
-        with self.state_manager.get_session() as session:
-            queue_item = session.query(DownloadQueue).filter(
-                DownloadQueue.id == queue_id
-            ).first()
-            
-            if queue_item:
-                queue_item.status = status
-                if error_message:
-                    queue_item.error_message = error_message
-                # session的commit在get_session上下文管理器中自动处理
-    
-    def _download_book(self, book: DoubanBook, queue_item_data: Dict[str, Any]) -> Optional[str]:
+    def _download_book(self, book: DoubanBook,
+                       queue_item_data: Dict[str, Any]) -> Tuple[Optional[str], int]:
         """
         下载书籍文件
 
@@ -333,7 +473,7 @@ class DownloadStage(BaseStage):
             queue_item_data: 队列项数据字典
 
         Returns:
-            Optional[str]: 下载的文件路径
+            Tuple[Optional[str], int]: (下载的文件路径, 文件大小)，下载失败时路径为None
         """
         try:
             # 发送下载开始通知
@@ -363,30 +503,18 @@ class DownloadStage(BaseStage):
                 'douban_id': book.douban_id
             }
             
-            # 使用ZLibraryService下载
-            file_path = self.zlibrary_service.download_book(book_info, str(self.download_dir))
+            # 使用ZLibraryService下载，文件大小取自写入的字节数，无需再读取文件
+            result = self.zlibrary_service.download_book_with_size(
+                book_info, self._download_dir_str)
+            if not result:
+                return None, 0
             
-            return file_path
+            return result
             
         except Exception as e:
             self.logger.error(f"下载书籍文件失败: {str(e)}")
             raise
     
-    def _get_file_size(self, file_path: str) -> int:
-        """
-        获取文件大小
-        
-        Args:
-            file_path: 文件路径
-            
-        Returns:
-            int: 文件大小（字节）
-        """
-        try:
-            return os.path.getsize(file_path)
-        except Exception:
-            return 0
-    
     # ===== 配额感知增强方法 =====
     
     async def process_book(self, book: DoubanBook) -> bool:
@@ -409,8 +537,10 @@ class DownloadStage(BaseStage):
         
         # 如果有配额管理器，先检查配额
         if self.quota_manager is not None:
+            # 缓存有效时直接返回，缺失或过期时异步刷新，避免在事件循环中同步请求API
+            await self.quota_manager.get_current_quota()
             if not self.quota_manager.has_quota_available():
-                self.logger.info(f"配额不足，跳过下载: {book.title}")
+                self.logger.info("配额不足，跳过下载: %s", book.title)
                 await self.handle_quota_exhausted(book)
                 return True
             
@@ -425,7 +555,7 @@ class DownloadStage(BaseStage):
             success = await self._download_book_async(book)
             if success:
                 book.status = BookStatus.DOWNLOAD_COMPLETE
-                self.logger.info(f"书籍下载完成: {book.title}")
+                self.logger.info("书籍下载完成: %s", book.title)
             return success
             
         except Exception as e:
@@ -461,12 +591,23 @@ class DownloadStage(BaseStage):
         Args:
             book: 当前处理的书籍
         """
-        # 更新书籍状态
+        # 更新书籍状态，立即写入数据库，进程崩溃时也不会丢失
         book.status = BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED
+        try:
+            with self.state_manager.get_session() as session:
+                # 只更新仍处于下载阶段可处理状态的书籍，避免覆盖其他阶段的进展
+                session.query(DoubanBook).filter(
+                    DoubanBook.id == book.id,
+                    DoubanBook.status.in_(_PROCESSABLE_BOOK_STATUSES)
+                ).update({DoubanBook.status: BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED},
+                         synchronize_session=False)
+        except Exception as e:
+            self.logger.error(f"更新配额耗尽书籍状态失败: {e}")
         
         # 记录日志
-        self.logger.info(f"配额不足，跳过下载任务: {book.title} (ID: {book.douban_id})")
-        self.logger.info(f"书籍状态已更新: {BookStatus.SEARCH_COMPLETE} -> {BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED}")
+        self.logger.info("配额不足，跳过下载任务: %s (ID: %s)", book.title, book.douban_id)
+        self.logger.info("书籍状态已更新: %s -> %s",
+                         BookStatus.SEARCH_COMPLETE, BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED)
         
         # 这里可以添加通知逻辑
         # TODO: 发送通知给监控系统
@@ -482,30 +623,25 @@ class DownloadStage(BaseStage):
             self.logger.warning("没有配额管理器，无法恢复跳过的书籍")
             return 0
         
-        # 检查当前配额
+        # 检查当前配额，剩余次数决定最多恢复多少本
         try:
-            has_quota = await self.check_quota_before_download()
-            if not has_quota:
+            quota = await self.quota_manager.get_current_quota()
+            if not quota.has_quota_available():
                 self.logger.info("配额仍然不足，不恢复跳过的书籍")
                 return 0
         except Exception as e:
             self.logger.error(f"检查配额时出错: {e}")
             return 0
         
-        # 查找配额耗尽的书籍
+        # 一次查询 + 一次批量更新，数据库往返次数与书籍数量无关
         try:
-            exhausted_books = await self._find_quota_exhausted_books()
+            resumed_count = self._queue_quota_exhausted_books(
+                quota.remaining_downloads)
             
-            if not exhausted_books:
+            if not resumed_count:
                 self.logger.info("没有找到需要恢复的书籍")
                 return 0
             
-            # 更新书籍状态
-            resumed_count = 0
-            for book in exhausted_books:
-                await self._update_book_status(book, BookStatus.DOWNLOAD_QUEUED)
-                resumed_count += 1
-            
             self.logger.info(f"配额已恢复，重新加入处理队列: {resumed_count} 本书籍")
             return resumed_count
             
@@ -513,29 +649,47 @@ class DownloadStage(BaseStage):
             self.logger.error(f"恢复跳过书籍时出错: {e}")
             return 0
     
-    async def _find_quota_exhausted_books(self) -> List[DoubanBook]:
-        """查找状态为SEARCH_COMPLETE_QUOTA_EXHAUSTED的书籍"""
+    def _queue_quota_exhausted_books(self, limit: int) -> int:
+        """
+        将最多 limit 本配额耗尽的书籍批量更新为DOWNLOAD_QUEUED
+        
+        Args:
+            limit: 最多恢复的书籍数量（当前剩余配额）
+            
+        Returns:
+            int: 更新的书籍数量
+        """
+        # 子查询选出要恢复的书籍，一条 UPDATE 完成，无需先把ID取回
+        book_ids = select(DoubanBook.id).where(
+            DoubanBook.status == BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED
+        ).order_by(DoubanBook.id).limit(limit).scalar_subquery()
+        
         with self.state_manager.get_session() as session:
-            books = session.query(DoubanBook).filter(
-                DoubanBook.status == BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED
+            # RETURNING 在同一条语句中取回被恢复的书籍，用于记录日志
+            resumed = session.execute(
+                update(DoubanBook).where(DoubanBook.id.in_(book_ids)).values(
+                    status=BookStatus.DOWNLOAD_QUEUED).returning(
+                        DoubanBook.id, DoubanBook.title),
+                execution_options={'synchronize_session': False}
             ).all()
-            return books
-    
-    async def _update_book_status(self, book: DoubanBook, new_status: BookStatus) -> None:
-        """更新书籍状态"""
-        with self.state_manager.get_session() as session:
-            book.status = new_status
-            session.merge(book)
-            session.commit()
-            self.logger.debug(f"书籍状态更新: {book.title} -> {new_status}")
+            if resumed and self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(
+                    "批量更新书籍状态: %d 本 -> %s: %s", len(resumed),
+                    BookStatus.DOWNLOAD_QUEUED,
+                    ", ".join(f"{title} (ID: {book_id})" for book_id, title in resumed))
+            return len(resumed)
     
     async def _download_book_async(self, book: DoubanBook) -> bool:
         """异步版本的书籍下载方法"""
-        # 调用现有的同步下载逻辑
-        # 这里可以根据实际需要进行异步改造
+        # 同步的下载逻辑（HTTP、磁盘和数据库）放到专用线程池中执行，
+        # 不阻塞事件循环，多个 process_book 可以并发下载且线程数有上限
+        loop = asyncio.get_running_loop()
         try:
-            result = self.process(book)  # 调用现有的同步process方法
-            return result
+            return await loop.run_in_executor(
+                self._download_executor, self.process, book)
+        except ProcessingError:
+            # 已分类的错误（网络、资源不存在、下载次数耗尽等）保留原类型
+            raise
         except Exception as e:
             self.logger.error(f"下载书籍失败: {e}")
             raise ProcessingError(f"下载失败: {e}")
\ No newline at end of file
@@ -6,14 +6,29 @@
 """
 
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import exists, insert
 
 from core.pipeline import (BaseStage, NetworkError, ProcessingError,
                            ResourceNotFoundError)
 from core.state_manager import BookStateManager
 from db.models import BookStatus, DoubanBook, DownloadQueue, ZLibraryBook
 from services.calibre_service import CalibreService
-from services.zlibrary_service import ZLibraryService
+from services.zlibrary_service import ZLibraryService, dump_raw_json
+
+# 搜索阶段可处理的书籍状态
+_SEARCHABLE_BOOK_STATUSES = frozenset((
+    BookStatus.DETAIL_COMPLETE,
+    BookStatus.SEARCH_QUEUED,
+    BookStatus.SEARCH_ACTIVE,
+))
+
+# 匹配分数相近时的格式优先级，数字越大越优先
+_FORMAT_PRIORITY = {'epub': 3, 'mobi': 2, 'pdf': 1, 'azw3': 2, 'txt': 0}
+
+# 新搜索结果每攒够这么多条执行一次批量插入
+_INSERT_CHUNK_SIZE = 50
 
 
 class SearchStage(BaseStage):
@@ -22,7 +37,8 @@ class SearchStage(BaseStage):
     def __init__(self, state_manager: BookStateManager,
                  zlibrary_service: ZLibraryService,
                  calibre_service: CalibreService,
-                 min_match_score: float = 0.6):
+                 min_match_score: float = 0.6,
+                 save_score_floor: Optional[float] = None):
         """
         初始化搜索阶段
         
@@ -31,11 +47,16 @@ class SearchStage(BaseStage):
             zlibrary_service: Z-Library服务实例
             calibre_service: Calibre服务实例
             min_match_score: 最低匹配分数阈值
+            save_score_floor: 保存搜索结果的最低匹配分数，低于该值的结果不写入数据库；
+                默认为 min_match_score 的一半，保留接近阈值的结果
         """
         super().__init__("search", state_manager)
         self.zlibrary_service = zlibrary_service
         self.calibre_service = calibre_service
         self.min_match_score = min_match_score
+        if save_score_floor is None:
+            save_score_floor = min_match_score * 0.5
+        self.save_score_floor = save_score_floor
         # 跟踪当前处理是否找到符合阈值的结果
         self._found_qualifying_results = False
         # 跟踪当前处理是否在Calibre中已存在
@@ -51,35 +72,47 @@ class SearchStage(BaseStage):
         Returns:
             bool: 是否可以处理
         """
+        return self._check_status(book)[0]
+
+    def _check_status(self, book: DoubanBook) -> Tuple[bool, Optional[BookStatus]]:
+        """
+        查询书籍的最新状态并判断是否可以处理
+        
+        Args:
+            book: 书籍对象
+            
+        Returns:
+            Tuple[bool, Optional[BookStatus]]: (是否可以处理, 数据库中的当前状态)，
+                书籍不存在时状态为None
+        """
         with self.state_manager.get_session() as session:
             # 重新查询数据库获取最新状态，避免使用缓存的book对象
             fresh_book = session.get(DoubanBook, book.id)
             if not fresh_book:
                 self.logger.warning(f"无法找到书籍: ID {book.id}")
-                return False
+                return False, None
             
             current_status = fresh_book.status
             
             # 接受DETAIL_COMPLETE、SEARCH_QUEUED和SEARCH_ACTIVE状态的书籍
-            can_process = current_status in [BookStatus.DETAIL_COMPLETE, BookStatus.SEARCH_QUEUED, BookStatus.SEARCH_ACTIVE]
+            can_process = current_status in _SEARCHABLE_BOOK_STATUSES
             
             # 对于DETAIL_FETCHING状态，这是正常的数据收集阶段，直接跳过，不记录错误
             if current_status == BookStatus.DETAIL_FETCHING:
                 self.logger.debug(f"书籍仍在数据收集阶段，跳过搜索处理: {book.title}, 状态: {current_status.value}")
-                return False
+                return False, current_status
             
             self.logger.info(f"状态检查 - 书籍: {book.title} (ID: {book.id}), 数据库状态: {current_status.value}, 传入状态: {book.status.value}, 可处理: {can_process}")
             
             # 对于其他不符合条件的状态，记录详细信息
             if not can_process:
-                acceptable_statuses = [BookStatus.DETAIL_COMPLETE, BookStatus.SEARCH_QUEUED, BookStatus.SEARCH_ACTIVE]
                 self.logger.warning(
                     f"书籍状态不符合搜索条件 - 书籍: {book.title} (ID: {book.id}), "
                     f"当前状态: {current_status.value}, "
-                    f"可接受状态: {[s.value for s in acceptable_statuses]}"
+                    f"可接受状态: {sorted(s.value for s in _SEARCHABLE_BOOK_STATUSES)}"
                 )
             
-            return can_process
+            return can_process, current_status
 
     def process(self, book: DoubanBook) -> bool:
         """
@@ -95,30 +128,35 @@ class SearchStage(BaseStage):
         self._found_qualifying_results = False
         self._calibre_exists = False
         
-        # 先检查是否可以处理这本书籍
-        if not self.can_process(book):
-            # 获取最新的书籍状态
-            with self.state_manager.get_session() as session:
-                fresh_book = session.get(DoubanBook, book.id)
-                current_status = fresh_book.status if fresh_book else book.status
-                
-                # 对于DETAIL_FETCHING状态，直接返回False，不抛出异常
-                if current_status == BookStatus.DETAIL_FETCHING:
-                    self.logger.info(f"书籍仍在数据收集阶段，跳过搜索处理: {book.title} (ID: {book.id}), 状态: {current_status.value}")
-                    return False
-                
-                # 对于其他状态不匹配的情况，抛出详细的错误信息
-                error_msg = (
-                    f"搜索阶段状态不匹配 - 书籍: {book.title} (ID: {book.id}), "
-                    f"当前状态: {current_status.value}, "
-                    f"期望状态: [DETAIL_COMPLETE, SEARCH_QUEUED, SEARCH_ACTIVE]"
-                )
-                self.logger.warning(error_msg)
-                raise ProcessingError(error_msg, "status_mismatch", retryable=True)
+        # 先检查是否可以处理这本书籍，检查时查到的最新状态直接复用
+        can_process, current_status = self._check_status(book)
+        if not can_process:
+            if current_status is None:
+                current_status = book.status
+            
+            # 对于DETAIL_FETCHING状态，直接返回False，不抛出异常
+            if current_status == BookStatus.DETAIL_FETCHING:
+                self.logger.info(f"书籍仍在数据收集阶段，跳过搜索处理: {book.title} (ID: {book.id}), 状态: {current_status.value}")
+                return False
+            
+            # 对于其他状态不匹配的情况，抛出详细的错误信息
+            error_msg = (
+                f"搜索阶段状态不匹配 - 书籍: {book.title} (ID: {book.id}), "
+                f"当前状态: {current_status.value}, "
+                f"期望状态: [DETAIL_COMPLETE, SEARCH_QUEUED, SEARCH_ACTIVE]"
+            )
+            self.logger.warning(error_msg)
+            raise ProcessingError(error_msg, "status_mismatch", retryable=True)
         
         try:
-            # 首先检查Calibre中是否已存在
+            # 首先检查Calibre中是否已存在：先查全库ISBN索引，未命中再模糊匹配
             self.logger.info(f"检查Calibre中是否存在: {book.title}")
+            calibre_id = self.calibre_service.find_by_isbn(book.isbn)
+            if calibre_id is not None:
+                self.logger.info(f"书籍在Calibre中已存在(ISBN): {book.title}, ID: {calibre_id}")
+                self._calibre_exists = True
+                return True
+
             calibre_match = self.calibre_service.find_best_match(
                 title=book.title,
                 author=book.author,
@@ -134,16 +172,19 @@ class SearchStage(BaseStage):
 
             # 检查是否已有搜索结果
             with self.state_manager.get_session() as session:
-                existing_results = session.query(ZLibraryBook).filter(
-                    ZLibraryBook.douban_id == book.douban_id).count()
-
-                if existing_results > 0:
-                    self.logger.info(f"书籍已有Z-Library搜索结果: {book.title}")
-                    # 检查是否有符合阈值的结果并成功添加到下载队列
-                    queue_added = self._add_best_match_to_queue(book)
-                    # 设置标志位，用于决定下一状态
-                    self._found_qualifying_results = queue_added
-                    return True
+                # EXISTS 在找到第一条记录时即返回，无需统计总数
+                has_results = session.query(
+                    session.query(ZLibraryBook.id).filter(
+                        ZLibraryBook.douban_id == book.douban_id).exists()
+                ).scalar()
+
+            if has_results:
+                self.logger.info(f"书籍已有Z-Library搜索结果: {book.title}")
+                # 检查是否有符合阈值的结果并成功添加到下载队列
+                queue_added = self._add_best_match_to_queue(book)
+                # 设置标志位，用于决定下一状态
+                self._found_qualifying_results = queue_added
+                return True
 
             # 执行搜索
             search_results = self.zlibrary_service.search_books(
@@ -156,7 +197,14 @@ class SearchStage(BaseStage):
                 raise ResourceNotFoundError(f"Z-Library未找到匹配书籍: {book.title}")
 
             # 保存搜索结果到数据库
-            saved_count = self._save_search_results(book, search_results)
+            saved_count, below_floor = self._save_search_results(book, search_results)
+
+            if saved_count == 0 and below_floor > 0:
+                # 所有结果的匹配分数都过低，没有可加入下载队列的结果
+                self.logger.warning(
+                    f"所有搜索结果匹配分数均低于 {self.save_score_floor}，未保存: {book.title}")
+                self._found_qualifying_results = False
+                return True
 
             if saved_count == 0:
                 self.logger.warning(f"未能保存任何搜索结果: {book.title}")
@@ -196,11 +244,11 @@ class SearchStage(BaseStage):
                 # 其他网络错误正常处理
                 raise
         except Exception as e:
-            import traceback
             error_details = f"异常类型: {type(e).__name__}, 错误: {str(e)}"
             self.logger.error(f"搜索书籍失败 - 书籍: {book.title} (ID: {book.id})")
             self.logger.error(f"错误详情: {error_details}")
-            self.logger.error(f"异常堆栈: {traceback.format_exc()}")
+            # 异常大多会被重新分类抛出，堆栈只在DEBUG级别由日志处理器格式化
+            self.logger.debug("异常堆栈", exc_info=True)
             
             # 特殊处理：如果是状态不匹配错误，允许重试
             if "状态不匹配" in str(e):
@@ -237,7 +285,7 @@ class SearchStage(BaseStage):
             return BookStatus.SEARCH_NO_RESULTS
 
     def _save_search_results(self, book: DoubanBook,
-                             search_results: List[Dict[str, Any]]) -> int:
+                             search_results: List[Dict[str, Any]]) -> Tuple[int, int]:
         """
         保存搜索结果到数据库
         
@@ -246,105 +294,160 @@ class SearchStage(BaseStage):
             search_results: 搜索结果列表
             
         Returns:
-            int: 保存的记录数量
+            Tuple[int, int]: (保存的记录数量, 因匹配分数低于 save_score_floor 而跳过的数量)
         """
         saved_count = 0
+        below_floor = 0
+        score_floor = self.save_score_floor
+        # 循环中每条新记录都要用到，只读取一次
+        douban_id = book.douban_id
+        index_result = self._index_search_result
+
+        # 一次性计算所有结果的匹配度得分
+        douban_info = {
+            'title': book.title or '',
+            'author': book.author or '',
+            'publisher': book.publisher or '',
+            'publish_date': book.publish_date or '',
+            'isbn': book.isbn or ''
+        }
 
         try:
+            match_scores = self.zlibrary_service.rank_candidates(
+                douban_info, search_results)
+
             with self.state_manager.get_session() as session:
-                for result in search_results:
+                # 一次查出该书已有的全部搜索结果，查重改为内存中的字典查找
+                by_zlibrary_id: Dict[str, Union[ZLibraryBook, dict]] = {}
+                by_content: Dict[tuple, Union[ZLibraryBook, dict]] = {}
+                for row in session.query(ZLibraryBook).filter(
+                        ZLibraryBook.douban_id == douban_id):
+                    index_result(
+                        row, row.zlibrary_id, row.title, row.authors, row.isbn,
+                        by_zlibrary_id, by_content)
+
+                # 新记录先收集为字典，循环结束后一次批量插入
+                new_rows: List[Dict[str, Any]] = []
+
+                for result, match_score in zip(search_results, match_scores):
                     zlibrary_id = result.get('zlibrary_id', '')
                     if not zlibrary_id:
                         self.logger.warning(f"搜索结果缺少zlibrary_id，跳过: {result.get('title', 'Unknown')}")
                         continue
+
+                    # 匹配分数过低的结果不可能被选中下载，不写入数据库
+                    if match_score < score_floor:
+                        below_floor += 1
+                        continue
                     
                     # 多层查重：优先使用 zlibrary_id，然后使用 title+authors+isbn 组合
                     existing = None
                     
                     # 第一层：通过 zlibrary_id 查重（最准确）
                     if zlibrary_id and zlibrary_id.strip():
-                        existing = session.query(ZLibraryBook).filter(
-                            ZLibraryBook.zlibrary_id == zlibrary_id,
-                            ZLibraryBook.douban_id == book.douban_id).first()
+                        existing = by_zlibrary_id.get(zlibrary_id)
                     
-                    # 第二层：如果没有 zlibrary_id 或第一层未找到，通过内容组合查重
-                    if not existing:
-                        title = result.get('title', '').strip()
-                        authors = result.get('authors', '').strip()
+                    # 第二层：如果没有 zlibrary_id 或第一层未找到，通过内容组合查重，
+                    # 至少需要书名和作者
+                    title = result.get('title', '').strip()
+                    authors = result.get('authors', '').strip()
+                    if not existing and title and authors:
+                        # 如果有ISBN，加入查重条件
                         isbn = result.get('isbn', '').strip()
-                        
-                        if title and authors:  # 至少需要书名和作者
-                            # 构建查询条件
-                            query_conditions = [
-                                ZLibraryBook.douban_id == book.douban_id,
-                                ZLibraryBook.title == title,
-                                ZLibraryBook.authors == authors
-                            ]
-                            
-                            # 如果有ISBN，加入查重条件
-                            if isbn:
-                                query_conditions.append(ZLibraryBook.isbn == isbn)
-                            
-                            existing = session.query(ZLibraryBook).filter(*query_conditions).first()
+                        existing = by_content.get((title, authors, isbn or None))
 
                     if existing:
-                        # 如果找到重复记录，更新 zlibrary_id（如果原记录没有ID但新数据有）
-                        if zlibrary_id and not existing.zlibrary_id:
+                        # 如果找到重复记录，更新 zlibrary_id（如果原记录没有ID但新数据有）；
+                        # 本批新增的记录（字典）一定带有 zlibrary_id，无需更新
+                        if (zlibrary_id and isinstance(existing, ZLibraryBook)
+                                and not existing.zlibrary_id):
                             existing.zlibrary_id = zlibrary_id
+                            by_zlibrary_id[zlibrary_id] = existing
                             existing.updated_at = datetime.now()
                             self.logger.info(f"更新Z-Library书籍ID: {existing.title} -> {zlibrary_id}")
                         else:
                             self.logger.debug(f"Z-Library书籍已存在，跳过: {title} (ID: {zlibrary_id or '无'})")
                         continue
 
-                    # 计算匹配度得分
-                    douban_info = {
-                        'title': book.title or '',
-                        'author': book.author or '',
-                        'publisher': book.publisher or '',
-                        'publish_date': book.publish_date or '',
-                        'isbn': book.isbn or ''
-                    }
-                    match_score = self.zlibrary_service.calculate_match_score(
-                        douban_info, result)
-
                     # 创建Z-Library书籍记录（包含新字段）
-                    zlibrary_book = ZLibraryBook(
-                        zlibrary_id=result.get('zlibrary_id', ''),
-                        douban_id=book.douban_id,
-                        title=result.get('title', ''),
-                        authors=result.get('authors', ''),
-                        publisher=result.get('publisher', ''),
-                        year=result.get('year', ''),
-                        edition=result.get('edition', ''),
-                        language=result.get('language', ''),
-                        isbn=result.get('isbn', ''),
-                        extension=result.get('extension', ''),
-                        size=result.get('size', ''),
-                        url=result.get('url', ''),
-                        cover=result.get('cover', ''),
-                        description=result.get('description', ''),
-                        categories=result.get('categories', ''),
-                        categories_url=result.get('categories_url', ''),
-                        download_url=result.get('download_url', ''),
-                        rating=result.get('rating', ''),
-                        quality=result.get('quality', ''),
-                        match_score=match_score,
-                        raw_json=result.get('raw_json', '{}'),
-                        is_available=True)
-
-                    session.add(zlibrary_book)
+                    row = {
+                        'zlibrary_id': result.get('zlibrary_id', ''),
+                        'douban_id': douban_id,
+                        'title': result.get('title', ''),
+                        'authors': result.get('authors', ''),
+                        'publisher': result.get('publisher', ''),
+                        'year': result.get('year', ''),
+                        'edition': result.get('edition', ''),
+                        'language': result.get('language', ''),
+                        'isbn': result.get('isbn', ''),
+                        'extension': result.get('extension', ''),
+                        'size': result.get('size', ''),
+                        'url': result.get('url', ''),
+                        'cover': result.get('cover', ''),
+                        'description': result.get('description', ''),
+                        'categories': result.get('categories', ''),
+                        'categories_url': result.get('categories_url', ''),
+                        'download_url': result.get('download_url', ''),
+                        'rating': result.get('rating', ''),
+                        'quality': result.get('quality', ''),
+                        'match_score': match_score,
+                        'raw_json': dump_raw_json(result),
+                        'is_available': True,
+                    }
+                    new_rows.append(row)
+                    # 同一批结果中的重复项也需要查重
+                    index_result(
+                        row, row['zlibrary_id'], row['title'], row['authors'],
+                        row['isbn'], by_zlibrary_id, by_content)
                     saved_count += 1
+                    if len(new_rows) >= _INSERT_CHUNK_SIZE:
+                        session.execute(insert(ZLibraryBook), new_rows)
+                        new_rows = []
+
+                # 绕过ORM工作单元，以 executemany 分块插入新记录
+                if new_rows:
+                    session.execute(insert(ZLibraryBook), new_rows)
 
                 # session的commit在get_session上下文管理器中自动处理
                 if saved_count > 0:
                     self.logger.info(f"保存了 {saved_count} 个Z-Library搜索结果")
+                if below_floor > 0:
+                    self.logger.debug(f"跳过 {below_floor} 个匹配分数低于 {score_floor} 的搜索结果")
 
-            return saved_count
+            return saved_count, below_floor
 
         except Exception as e:
             self.logger.error(f"保存搜索结果失败: {str(e)}")
-            return 0
+            return 0, 0
+
+    @staticmethod
+    def _index_search_result(record: Union[ZLibraryBook, dict],
+                             zlibrary_id: str, title: str, authors: str,
+                             isbn: str,
+                             by_zlibrary_id: Dict[str, Union[ZLibraryBook, dict]],
+                             by_content: Dict[tuple, Union[ZLibraryBook, dict]]) -> None:
+        """
+        将搜索结果记录加入查重索引
+        
+        内容索引同时登记 (书名, 作者, ISBN) 和 (书名, 作者, None) 两个键，
+        后者对应没有ISBN的新结果只按书名和作者查重。
+        
+        Args:
+            record: 已有的Z-Library书籍记录，或本批待插入的记录字典
+            zlibrary_id: Z-Library书籍ID
+            title: 书名
+            authors: 作者
+            isbn: ISBN
+            by_zlibrary_id: zlibrary_id -> 记录
+            by_content: (书名, 作者, ISBN或None) -> 记录
+        """
+        if zlibrary_id:
+            by_zlibrary_id.setdefault(zlibrary_id, record)
+        title = title or ''
+        authors = authors or ''
+        by_content.setdefault((title, authors, None), record)
+        if isbn:
+            by_content.setdefault((title, authors, isbn), record)
 
     def _add_best_match_to_queue(self, book: DoubanBook) -> bool:
         """
@@ -358,21 +461,27 @@ class SearchStage(BaseStage):
         """
         try:
             with self.state_manager.get_session() as session:
-                # 检查是否已在下载队列中
-                existing_queue_item = session.query(DownloadQueue).filter(
-                    DownloadQueue.douban_book_id == book.id).first()
+                in_queue = exists().where(DownloadQueue.douban_book_id == book.id)
                 
-                if existing_queue_item:
-                    self.logger.info(f"书籍已在下载队列中: {book.title}")
-                    return True
-                
-                # 获取所有搜索结果，按匹配分数降序排列
-                zlibrary_books = session.query(ZLibraryBook).filter(
+                # 只取匹配分数最高的3个结果，后续的格式优选只考虑这些；
+                # 同一查询中附带是否已在下载队列中的标记
+                rows = session.query(ZLibraryBook, in_queue.label('in_queue')).filter(
                     ZLibraryBook.douban_id == book.douban_id,
                     ZLibraryBook.is_available.is_(True),
                     ZLibraryBook.match_score >= self.min_match_score
-                ).order_by(ZLibraryBook.match_score.desc()).all()
+                ).order_by(ZLibraryBook.match_score.desc()).limit(3).all()
+                
+                # 没有符合条件的结果时查询不返回行，需单独检查队列
+                if rows:
+                    already_queued = rows[0].in_queue
+                else:
+                    already_queued = session.query(in_queue).scalar()
+                
+                if already_queued:
+                    self.logger.info(f"书籍已在下载队列中: {book.title}")
+                    return True
                 
+                zlibrary_books = [row.ZLibraryBook for row in rows]
                 if not zlibrary_books:
                     self.logger.warning(f"未找到符合最低匹配分数({self.min_match_score})的结果: {book.title}")
                     return False
@@ -381,17 +490,17 @@ class SearchStage(BaseStage):
                 best_match = zlibrary_books[0]
                 
                 # 考虑格式优先级进行微调
-                format_priority = {'epub': 3, 'mobi': 2, 'pdf': 1, 'azw3': 2, 'txt': 0}
                 best_candidate = best_match
+                best_format_score = _FORMAT_PRIORITY.get((best_match.extension or '').lower(), 0)
                 
                 # 如果有多个高分结果（分差小于0.1），选择格式更优的
-                for zlib_book in zlibrary_books[:3]:  # 只考虑前3个结果
+                for zlib_book in zlibrary_books:  # 只考虑前3个结果
                     if (best_match.match_score - zlib_book.match_score) <= 0.1:
-                        current_format_score = format_priority.get(zlib_book.extension.lower() if zlib_book.extension else '', 0)
-                        best_format_score = format_priority.get(best_candidate.extension.lower() if best_candidate.extension else '', 0)
+                        current_format_score = _FORMAT_PRIORITY.get((zlib_book.extension or '').lower(), 0)
                         
                         if current_format_score > best_format_score:
                             best_candidate = zlib_book
+                            best_format_score = current_format_score
                 
                 # 创建下载队列项
                 queue_item = DownloadQueue(
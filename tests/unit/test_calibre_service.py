@@ -2,12 +2,14 @@
 """
 CalibreService 单元测试
 """
+import json
 from pathlib import Path
 
 import pytest
+import requests
 
 from config.config_manager import ConfigManager
-from services.calibre_service import CalibreService
+from services.calibre_service import CalibreService, CalibredbResult
 
 
 @pytest.fixture
@@ -96,6 +98,180 @@ def test_similarity_calculation(calibre_service):
     assert 0.0 < similarity < 1.0
 
 
+def test_similarity_case_insensitive(calibre_service):
+    """测试相似度计算忽略大小写，并接受预先切分的词集合"""
+    assert calibre_service._calculate_similarity("Python Guide",
+                                                 "python guide") == 1.0
+    assert calibre_service._calculate_similarity(
+        frozenset({"python", "guide"}), "PYTHON GUIDE") == 1.0
+
+
+def test_similarity_penalizes_subset_titles(calibre_service):
+    """测试子集标题不会被当作完全匹配"""
+    similarity = calibre_service._calculate_similarity("Python",
+                                                       "Python Cookbook")
+    assert similarity < 1.0
+
+    book = {'title': 'Python Cookbook', 'author': 'David Beazley'}
+    assert calibre_service._calculate_match_score(
+        book, 'Python', None, None) < calibre_service.match_threshold
+
+
+def test_match_score_normalizes_isbn(calibre_service):
+    """测试 ISBN 比较忽略分隔符、前缀，并兼容 ISBN-10"""
+    book = {'title': '三体', 'author': '刘慈欣', 'isbn': '9787536692930'}
+
+    assert calibre_service._calculate_match_score(
+        book, 'other', None, 'ISBN: 978-7-5366-9293-0') == 1.0
+    assert calibre_service._calculate_match_score(
+        book, 'other', None, '7536692935') == 1.0
+
+
+def test_match_score_compares_unnormalizable_isbn_as_text(calibre_service):
+    """测试无法归一化的 ISBN 回退到原始字符串比较"""
+    book = {'title': '三体', 'author': '刘慈欣', 'isbn': 'B00ABCDEFG'}
+
+    assert calibre_service._calculate_match_score(
+        book, 'other', None, ' B00ABCDEFG ') == 1.0
+    assert calibre_service._calculate_match_score(
+        book, 'other', None, 'B00ABCDEFX') < 1.0
+
+
+def test_match_score_rejects_cjk_sequel(calibre_service):
+    """测试不含空格的中文续集书名即使作者相同也不会匹配"""
+    book = {'title': '三体II', 'author': '刘慈欣'}
+
+    assert calibre_service._calculate_match_score(
+        book, '三体', '刘慈欣', None) < calibre_service.match_threshold
+    assert calibre_service._calculate_match_score(
+        {'title': '三体', 'author': '刘慈欣'}, '三体', '刘慈欣',
+        None) >= calibre_service.match_threshold
+
+
+def test_match_score_does_not_mutate_book(calibre_service):
+    """测试匹配评分不会向书籍字典写入内部字段，结果可直接 JSON 序列化"""
+    book = {'calibre_id': 7, 'title': 'Python Guide', 'author': 'Guido'}
+
+    calibre_service._calculate_match_score(book, 'Python Guide', 'Guido', None)
+
+    assert book == {'calibre_id': 7, 'title': 'Python Guide', 'author': 'Guido'}
+    json.dumps(book)
+
+
+def _fake_response(status_code, content=b''):
+    """构造测试用的 requests 响应"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.url = 'http://localhost:8080/ajax/search'
+    return response
+
+
+def test_http_search_uses_content_server(calibre_service, monkeypatch):
+    """测试 Content Server 可用时通过 AJAX 接口搜索，并使用较短的连接超时"""
+    requests_made = []
+
+    def fake_get(url, params=None, timeout=None):
+        requests_made.append(timeout)
+        return _fake_response(200, b'{"book_ids": [3, 1]}')
+
+    monkeypatch.setattr(calibre_service, '_http_enabled', True)
+    monkeypatch.setattr(calibre_service._session, 'get', fake_get)
+
+    assert calibre_service._http_search('title:~python') == [3, 1]
+    connect_timeout, read_timeout = requests_made[0]
+    assert connect_timeout < read_timeout
+
+
+def test_http_auth_failure_falls_back_to_calibredb(calibre_service,
+                                                  monkeypatch):
+    """测试接口认证失败后停用 HTTP，并回退到 calibredb"""
+    requests_made = []
+    book = {'calibre_id': 5, 'title': 'Python Guide', 'author': 'Guido'}
+
+    def fake_get(url, params=None, timeout=None):
+        requests_made.append(url)
+        return _fake_response(401)
+
+    monkeypatch.setattr(calibre_service, '_http_enabled', True)
+    monkeypatch.setattr(calibre_service._session, 'get', fake_get)
+    monkeypatch.setattr(
+        calibre_service, '_execute_calibredb_command',
+        lambda args: CalibredbResult(stdout='5', stderr='', returncode=0))
+    monkeypatch.setattr(calibre_service, '_get_books_info',
+                        lambda book_ids: [book] if book_ids == [5] else [])
+    calibre_service.clear_cache()
+
+    assert calibre_service.search_book('Python Guide') == [book]
+    assert calibre_service.search_book('Other Title') == [book]
+    assert len(requests_made) == 1
+    assert calibre_service._http_enabled is False
+
+
+def test_find_by_isbn_skips_invalid_and_rebuilds_after_clear(
+        calibre_service, monkeypatch):
+    """测试格式无效的 ISBN 不影响索引构建，清空缓存后重建索引"""
+    listings = [[{'id': 1, 'identifiers': {'isbn': '12X4567890'}},
+                 {'id': 2, 'identifiers': {'isbn': '9787536692930'}}],
+                [{'id': 3, 'identifiers': {'isbn': '9787020002207'}}]]
+
+    def fake_execute(args):
+        return CalibredbResult(stdout=json.dumps(listings.pop(0)),
+                               stderr='', returncode=0)
+
+    monkeypatch.setattr(calibre_service, '_execute_calibredb_bytes',
+                        fake_execute)
+    calibre_service.clear_cache()
+
+    assert calibre_service.find_by_isbn('978-7-5366-9293-0') == 2
+    assert calibre_service.find_by_isbn('12X4567890') is None
+    assert calibre_service.find_by_isbn('9787020002207') is None
+
+    calibre_service.clear_cache()
+    assert calibre_service.find_by_isbn('9787020002207') == 3
+
+
+def test_find_best_match_caches_result(calibre_service, monkeypatch):
+    """测试相同查询复用最佳匹配结果，清空缓存后重新搜索"""
+    calls = []
+    book = {'calibre_id': 1, 'title': 'Python Guide', 'author': 'Guido'}
+
+    def fake_search(title, author=None, isbn=None):
+        calls.append(title)
+        return [book]
+
+    monkeypatch.setattr(calibre_service, 'search_book', fake_search)
+    calibre_service.clear_cache()
+
+    assert calibre_service.find_best_match('Python Guide', 'Guido') is book
+    assert calibre_service.find_best_match(' python guide', 'GUIDO') is book
+    assert len(calls) == 1
+
+    calibre_service.clear_cache()
+    calibre_service.find_best_match('Python Guide', 'Guido')
+    assert len(calls) == 2
+
+
+def test_find_best_match_cache_expires(calibre_service, monkeypatch):
+    """测试未匹配的结果在缓存有效期后重新查询"""
+    calls = []
+
+    def fake_search(title, author=None, isbn=None):
+        calls.append(title)
+        return [{'calibre_id': 1, 'title': 'Other Book', 'author': 'Nobody'}]
+
+    monkeypatch.setattr(calibre_service, 'search_book', fake_search)
+    calibre_service.clear_cache()
+
+    assert calibre_service.find_best_match('Python Guide', 'Guido') is None
+    assert calibre_service.find_best_match('Python Guide', 'Guido') is None
+    assert len(calls) == 1
+
+    monkeypatch.setattr(calibre_service, '_book_cache_ttl', 0.0)
+    calibre_service.find_best_match('Python Guide', 'Guido')
+    assert len(calls) == 2
+
+
 def test_match_threshold_validation(calibre_service):
     """测试匹配阈值配置"""
     threshold = calibre_service.match_threshold
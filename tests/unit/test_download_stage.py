@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+DownloadStage 队列领取与配额处理单元测试
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from core.pipeline import ProcessingError
+from core.state_manager import BookStateManager
+from db.models import (Base, BookStatus, DoubanBook, DownloadQueue,
+                       ZLibraryBook)
+from stages.download_stage import DownloadStage
+
+
+@pytest.fixture
+def engine():
+    """创建内存 SQLite 数据库"""
+    engine = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    """创建会话工厂"""
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def stage(session_factory, tmp_path):
+    """创建不连接 Z-Library 的下载阶段"""
+    state_manager = BookStateManager(session_factory=session_factory)
+    stage = DownloadStage(state_manager, zlibrary_service=None,
+                          download_dir=str(tmp_path))
+    yield stage
+    stage._download_executor.shutdown(wait=False)
+
+
+def _add_book(session_factory, douban_id, status, queue_status=None):
+    """添加书籍，queue_status 不为None时同时添加下载队列项"""
+    with session_factory() as session:
+        book = DoubanBook(douban_id=douban_id, title=f"书籍{douban_id}",
+                          status=status)
+        session.add(book)
+        session.flush()
+        if queue_status is not None:
+            zlib_book = ZLibraryBook(douban_id=douban_id,
+                                     zlibrary_id=f"z{douban_id}",
+                                     title=book.title, extension='epub')
+            session.add(zlib_book)
+            session.flush()
+            session.add(DownloadQueue(douban_book_id=book.id,
+                                      zlibrary_book_id=zlib_book.id,
+                                      download_url='https://dl.example/file',
+                                      status=queue_status))
+        session.commit()
+        return book
+
+
+def _queue_status(session_factory, book_id):
+    with session_factory() as session:
+        return session.query(DownloadQueue.status).filter(
+            DownloadQueue.douban_book_id == book_id).scalar()
+
+
+def _book_status(session_factory, book_id):
+    with session_factory() as session:
+        return session.get(DoubanBook, book_id).status
+
+
+def test_claim_queue_item_marks_downloading(stage, session_factory):
+    """测试领取队列项后标记为正在下载"""
+    book = _add_book(session_factory, '1', BookStatus.DOWNLOAD_QUEUED, 'queued')
+
+    existing_path, item = stage._claim_queue_item(book)
+
+    assert existing_path is None
+    assert item['zlibrary_id'] == 'z1'
+    assert item['status'] == 'downloading'
+    assert _queue_status(session_factory, book.id) == 'downloading'
+
+
+def test_claim_queue_item_loses_race(stage, session_factory, engine):
+    """测试查询与更新之间队列项被其他工作线程改变时不领取"""
+    book = _add_book(session_factory, '1', BookStatus.DOWNLOAD_QUEUED, 'queued')
+
+    def complete_before_claim(conn, cursor, statement, *args):
+        # 在领取的 UPDATE 执行前，模拟另一个工作线程已完成该队列项
+        if statement.startswith('UPDATE download_queue'):
+            cursor.execute(
+                "UPDATE download_queue SET status = 'completed'")
+
+    event.listen(engine, 'before_cursor_execute', complete_before_claim)
+    try:
+        assert stage._claim_queue_item(book) == (None, None)
+    finally:
+        event.remove(engine, 'before_cursor_execute', complete_before_claim)
+
+    assert _queue_status(session_factory, book.id) == 'completed'
+
+
+def test_claim_queue_item_rejects_unprocessable_status(stage, session_factory):
+    """测试书籍已进入其他阶段时抛出不可重试的状态不匹配错误"""
+    book = _add_book(session_factory, '1', BookStatus.UPLOAD_QUEUED, 'queued')
+
+    with pytest.raises(ProcessingError, match="状态不匹配") as exc_info:
+        stage._claim_queue_item(book)
+
+    assert not exc_info.value.retryable
+    assert _queue_status(session_factory, book.id) == 'queued'
+
+
+def test_queue_quota_exhausted_books_respects_limit(stage, session_factory):
+    """测试恢复配额耗尽的书籍时不超过剩余配额"""
+    books = [
+        _add_book(session_factory, str(i),
+                  BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED)
+        for i in range(1, 4)
+    ]
+    other = _add_book(session_factory, '9', BookStatus.SEARCH_COMPLETE)
+
+    assert stage._queue_quota_exhausted_books(2) == 2
+
+    statuses = [_book_status(session_factory, book.id) for book in books]
+    assert statuses == [BookStatus.DOWNLOAD_QUEUED, BookStatus.DOWNLOAD_QUEUED,
+                        BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED]
+    assert _book_status(session_factory, other.id) == BookStatus.SEARCH_COMPLETE
+
+
+def test_handle_quota_exhausted_updates_processable_book(stage,
+                                                        session_factory):
+    """测试配额耗尽时将下载阶段的书籍标记为配额耗尽"""
+    book = _add_book(session_factory, '1', BookStatus.DOWNLOAD_QUEUED)
+
+    asyncio.run(stage.handle_quota_exhausted(book))
+
+    assert (_book_status(session_factory, book.id)
+            == BookStatus.SEARCH_COMPLETE_QUOTA_EXHAUSTED)
+
+
+def test_handle_quota_exhausted_keeps_later_stage(stage, session_factory):
+    """测试配额耗尽时不覆盖已进入其他阶段的书籍状态"""
+    book = _add_book(session_factory, '1', BookStatus.UPLOAD_QUEUED)
+
+    asyncio.run(stage.handle_quota_exhausted(book))
+
+    assert _book_status(session_factory, book.id) == BookStatus.UPLOAD_QUEUED
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+QuotaManager 单元测试
+"""
+import time
+
+import pytest
+
+from core.quota_manager import DownloadQuota, QuotaManager
+
+
+class FakeZLibraryService:
+    """记录调用次数的下载限制服务"""
+
+    def __init__(self, limits=None, error=None):
+        self.limits = limits
+        self.error = error
+        self.calls = 0
+
+    def get_download_limits(self, force_refresh=False, raise_on_error=False):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.limits
+
+
+@pytest.fixture
+def quota_manager():
+    """创建不连接 Z-Library 的 QuotaManager"""
+    return QuotaManager(email="test@example.com", password="test_password")
+
+
+def _expired_quota(remaining: int) -> DownloadQuota:
+    """构造已过期的配额缓存"""
+    return DownloadQuota(remaining_downloads=remaining,
+                         daily_limit=10,
+                         last_checked=time.monotonic() - 3600)
+
+
+def test_has_quota_available_refreshes_expired_cache(quota_manager):
+    """测试缓存过期时刷新配额"""
+    service = FakeZLibraryService(limits={
+        'daily_amount': 10,
+        'daily_remaining': 3,
+        'daily_reset': 0
+    })
+    quota_manager._zlibrary_service = service
+    quota_manager._cached_quota = _expired_quota(0)
+
+    assert quota_manager.has_quota_available() is True
+    assert service.calls == 1
+    assert quota_manager._cached_quota.remaining_downloads == 3
+
+    # 刷新后的缓存仍有效，不再请求
+    assert quota_manager.has_quota_available() is True
+    assert service.calls == 1
+
+
+def test_has_quota_available_keeps_old_value_on_failure(quota_manager):
+    """测试刷新失败时保留原有配额缓存"""
+    quota_manager._zlibrary_service = FakeZLibraryService(
+        error=TimeoutError("limits request timed out"))
+    old_quota = _expired_quota(2)
+    quota_manager._cached_quota = old_quota
+
+    assert quota_manager.has_quota_available() is True
+    assert quota_manager._cached_quota is old_quota
+
+
+def test_has_quota_available_without_cache_fails_closed(quota_manager):
+    """测试刷新失败且没有缓存时视为没有配额"""
+    quota_manager._zlibrary_service = FakeZLibraryService(
+        error=TimeoutError("limits request timed out"))
+
+    assert quota_manager.has_quota_available() is False
+    assert quota_manager._cached_quota is None
+
+
+def test_has_quota_available_cache_only(quota_manager):
+    """测试只读缓存时不请求 API"""
+    service = FakeZLibraryService(error=AssertionError("should not be called"))
+    quota_manager._zlibrary_service = service
+
+    assert quota_manager.has_quota_available(refresh=False) is False
+    quota_manager._cached_quota = _expired_quota(1)
+    assert quota_manager.has_quota_available(refresh=False) is True
+    assert service.calls == 0
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+SearchStage 搜索结果保存单元测试
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from core.state_manager import BookStateManager
+from db.models import Base, BookStatus, DoubanBook, ZLibraryBook
+from stages.search_stage import _INSERT_CHUNK_SIZE, SearchStage
+
+
+class FakeZLibraryService:
+    """按结果中的 score 字段返回匹配分数"""
+
+    def rank_candidates(self, douban_info, candidates):
+        return [candidate.get('score', 0.9) for candidate in candidates]
+
+
+@pytest.fixture
+def session_factory():
+    """创建内存 SQLite 数据库的会话工厂"""
+    engine = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, expire_on_commit=False)
+    engine.dispose()
+
+
+@pytest.fixture
+def stage(session_factory):
+    """创建使用假 Z-Library 服务的搜索阶段"""
+    state_manager = BookStateManager(session_factory=session_factory)
+    return SearchStage(state_manager, FakeZLibraryService(),
+                       calibre_service=None, min_match_score=0.6)
+
+
+@pytest.fixture
+def book(session_factory):
+    """添加正在搜索的书籍"""
+    with session_factory() as session:
+        book = DoubanBook(douban_id='d1', title='三体', author='刘慈欣',
+                          status=BookStatus.SEARCH_ACTIVE)
+        session.add(book)
+        session.commit()
+        return book
+
+
+def _result(index, **overrides):
+    result = {
+        'zlibrary_id': f"z{index}",
+        'title': f"书名{index}",
+        'authors': f"作者{index}",
+        'extension': 'epub',
+    }
+    result.update(overrides)
+    return result
+
+
+def _stored(session_factory):
+    with session_factory() as session:
+        return {row.zlibrary_id: row for row in session.query(ZLibraryBook)}
+
+
+def test_save_search_results_skips_duplicates_across_chunks(
+        stage, book, session_factory):
+    """测试跨插入分块的重复结果只保存一次"""
+    count = _INSERT_CHUNK_SIZE * 2 + 10
+    results = [_result(i) for i in range(count)]
+    # 与第一个分块中已插入的结果重复：相同ID，以及相同书名和作者
+    results.append(_result(5, title='其他书名'))
+    results.append(_result(count, title='书名7', authors='作者7'))
+
+    assert stage._save_search_results(book, results) == (count, 0)
+    assert len(_stored(session_factory)) == count
+
+
+def test_save_search_results_skips_stored_candidates(
+        stage, book, session_factory):
+    """测试已保存的结果不重复插入，缺少ID的已有记录补上ID"""
+    with session_factory() as session:
+        session.add(ZLibraryBook(douban_id='d1', zlibrary_id='z1',
+                                 title='书名1', authors='作者1'))
+        session.add(ZLibraryBook(douban_id='d1', zlibrary_id='',
+                                 title='书名2', authors='作者2', isbn=''))
+        session.commit()
+
+    saved = stage._save_search_results(
+        book, [_result(1), _result(2, isbn=''), _result(3)])
+
+    assert saved == (1, 0)
+    stored = _stored(session_factory)
+    assert sorted(stored) == ['z1', 'z2', 'z3']
+    assert stored['z2'].title == '书名2'
+
+
+def test_save_search_results_filters_below_floor(stage, book, session_factory):
+    """测试匹配分数低于 save_score_floor 的结果不写入数据库"""
+    assert stage.save_score_floor == pytest.approx(0.3)
+    results = [
+        _result(1, score=0.9),
+        _result(2, score=0.3),
+        _result(3, score=0.29),
+        _result(4, score=0.0),
+    ]
+
+    assert stage._save_search_results(book, results) == (2, 2)
+    stored = _stored(session_factory)
+    assert sorted(stored) == ['z1', 'z2']
+    assert stored['z2'].match_score == pytest.approx(0.3)
@@ -4,6 +4,7 @@ Z-Library 服务模块单元测试
 使用真实配置进行测试，不使用mock
 """
 
+import io
 import os
 import sys
 import tempfile
@@ -18,7 +19,8 @@ FILE_DIR = Path(__file__).resolve().parent
 sys.path.insert(0, str(FILE_DIR.parents[1]))
 
 from config.config_manager import ConfigManager
-from services.zlibrary_service import ZLibraryService
+from core.pipeline import ProcessingError
+from services.zlibrary_service import ZLibraryClient, ZLibraryService
 from utils.logger import get_logger
 
 
@@ -299,6 +301,126 @@ class TestZLibraryService:
         assert scored_results[1][1] >= scored_results[2][1]
 
 
+
+@pytest.fixture
+def offline_service(monkeypatch):
+    """创建不发起网络请求的 ZLibraryService 实例（跳过登录）"""
+    monkeypatch.setattr(ZLibraryClient, 'ensure_connected', lambda self: True)
+    service = ZLibraryService(email="test@example.com",
+                              password="test_password")
+    yield service
+    service.close()
+
+
+def test_check_download_available_fails_closed(offline_service, monkeypatch):
+    """测试获取下载限制失败时视为不可下载"""
+    def failing_fetch():
+        raise TimeoutError("limits request timed out")
+
+    monkeypatch.setattr(offline_service, '_fetch_limits', failing_fetch)
+
+    assert offline_service.check_download_available() is False
+
+
+class _FakeResponse:
+    """分段下载测试用的流式响应"""
+
+    def __init__(self, status_code, body=b'', url='https://dl.example/file'):
+        self.status_code = status_code
+        self.url = url
+        self.headers = {}
+        self.raw = io.BytesIO(body)
+        self._body = body
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _FakeSession:
+    """按 Range 请求头返回响应的会话"""
+
+    def __init__(self, body, range_status=206, full_status=200,
+                 truncate_parts=False):
+        self.body = body
+        self.range_status = range_status
+        self.full_status = full_status
+        self.truncate_parts = truncate_parts
+        self.proxies = {}
+
+    def get(self, url, headers=None, proxies=None, stream=False, timeout=None):
+        byte_range = (headers or {}).get('Range')
+        if byte_range is None:
+            return _FakeResponse(self.full_status, self.body, url)
+        if self.range_status != 206:
+            # 忽略 Range，返回完整内容
+            return _FakeResponse(self.range_status, self.body, url)
+        start, end = map(int, byte_range[len('bytes='):].split('-'))
+        part = self.body[start:end + 1]
+        if self.truncate_parts:
+            part = part[:-1]
+        return _FakeResponse(206, part, url)
+
+
+_RANGED_BODY = bytes(range(40))
+
+
+def test_ranged_download_writes_all_parts(offline_service, tmp_path):
+    """测试各分段写入文件的正确位置"""
+    file_path = tmp_path / 'book.epub'
+    session = _FakeSession(_RANGED_BODY)
+
+    written = offline_service.download_service._download_ranged(
+        session, _FakeResponse(200), {}, file_path, len(_RANGED_BODY))
+
+    assert written == len(_RANGED_BODY)
+    assert file_path.read_bytes() == _RANGED_BODY
+
+
+def test_ranged_download_falls_back_when_range_ignored(offline_service,
+                                                       tmp_path):
+    """测试服务器忽略 Range 返回200时回退到单连接下载"""
+    file_path = tmp_path / 'book.epub'
+    session = _FakeSession(_RANGED_BODY, range_status=200)
+
+    written = offline_service.download_service._download_ranged(
+        session, _FakeResponse(200), {}, file_path, len(_RANGED_BODY))
+
+    assert written == len(_RANGED_BODY)
+    assert file_path.read_bytes() == _RANGED_BODY
+
+
+def test_fetch_ranges_rejects_short_part(offline_service, tmp_path):
+    """测试分段数据少于请求范围时报错"""
+    session = _FakeSession(_RANGED_BODY, truncate_parts=True)
+
+    with pytest.raises(ProcessingError):
+        offline_service.download_service._fetch_ranges(
+            session, 'https://dl.example/file', {}, tmp_path / 'book.epub',
+            len(_RANGED_BODY))
+
+
+def test_ranged_download_removes_partial_file_on_failure(offline_service,
+                                                         tmp_path):
+    """测试分段与单连接下载都失败时删除不完整的文件"""
+    file_path = tmp_path / 'book.epub'
+    session = _FakeSession(_RANGED_BODY, truncate_parts=True, full_status=500)
+
+    with pytest.raises(ProcessingError):
+        offline_service.download_service._download_ranged(
+            session, _FakeResponse(200), {}, file_path, len(_RANGED_BODY))
+
+    assert not file_path.exists()
+
 if __name__ == "__main__":
     # 使用pytest运行测试
     pytest.main([__file__, "-v"])
\ No newline at end of file